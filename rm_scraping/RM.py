@@ -1,13 +1,15 @@
-import dateparser
 import pprint
-import logging
 import re
-from collections import defaultdict, Counter
+from collections import defaultdict, namedtuple, Counter
 import wikitextparser as wtp
 
-from comment_extractor import CommentExtractor
+import diagnostics
+import metrics
+from comment_extractor import CommentExtractor, CLOSE, NOM, DISCUSSION
 from constants import *
 from exceptions import *
+from timestamps import parse_date
+from vote_classes import vote_power
 
 def parse_anchor(anchor):
   s = anchor.strip()
@@ -19,6 +21,13 @@ def find_template(parsed, name):
     if t.name == name:
       return t
 
+# What's left of an RM once it's been parsed: just the parts that get written
+# out, as plain data. Hang on to these rather than RMs, so that the parse tree
+# and comments of each RM can be freed as soon as it's parsed. (Also cheap to
+# send between processes.)
+RMRecord = namedtuple('RMRecord',
+    ['id', 'row', 'votes', 'user_to_policies', 'moves', 'section_ix'])
+
 class RM(object):
   ROW_DEFAULTS = dict(
     mrv_date=None,
@@ -51,26 +60,55 @@ class RM(object):
       # in this case, from_title and to_title are just the first listed move.
       'n_articles', 'all_froms', 'all_tos', 
   ]
+  # Columns filled in by each stage of parsing (see plan). Those in
+  # IDENTITY_COLS are always filled in.
+  IDENTITY_COLS = ['rm_link', 'article', 'talkpage', 'id', 'chars']
+  MRV_COLS = ['mrv', 'mrv_date', 'mrv_result']
+  CLOSE_COLS = ['close_date', 'closer', 'outcome']
+  NOM_COLS = ['from_title', 'to_title', 'nom_date', 'nominator', 'n_relists',
+      'n_articles', 'all_froms', 'all_tos']
+  DISCUSSION_COLS = ['n_comments', 'n_participants', 'n_votes']
   VOTE_COLS = ['user', 'vote', 'date', 'rm_id']
+  # One row per article the nom proposes moving, in the order listed. The
+  # first is the same as from_title/to_title in the rms table.
+  MOVE_COLS = ['rm_id', 'ordinal', 'from_title', 'to_title', 'struck_title']
   POL_COLS = ['user', 'pol', 'n', 'rm_id']
 
-  def __init__(self, section, pagename, debug=0, id=None):
+  def __init__(self, section, pagename, debug=0, id=None, cols=None, votes=True,
+      pols=True, moves=None):
+    """If cols (a subset of COLS) is given, only the stages of parsing needed
+    to fill in those columns are run, and row has just those columns (plus
+    IDENTITY_COLS). Similarly, votes, pols and moves say whether we need
+    self.votes, self.user_to_policies and self.moves. If not, they're left
+    empty. By default, moves are wanted along with the nom columns.
+    """
     self.debug = debug
     self.text = section
-    self.lines = self.text.split('\n')
-    self.where = 0 # current line number
-    self.parsed = wtp.parse(section)
+    self.want_votes = votes
+    self.want_pols = pols
+    self.want_moves = self.wants_moves(cols, moves)
+    self.mrv_needed, self.upto = self.plan(cols, votes, pols, moves)
+    if self.mrv_needed:
+      with metrics.timer('wtp_parse'):
+        self.parsed = wtp.parse(section)
+      heading = self.parsed
+    else:
+      # All we need is the section title, from the first line
+      self.parsed = None
+      heading = wtp.parse(section.split('\n', 1)[0])
     pre = 'Talk:'
     assert pagename.startswith(pre)
     self.row = self.ROW_DEFAULTS.copy()
     self.row['article'] = pagename[len(pre):(pagename.find('/') if '/' in pagename else None)]
-    self.row['rm_link'] = pagename + '#' + parse_anchor(self.parsed.sections[1].title)
+    self.row['rm_link'] = pagename + '#' + parse_anchor(heading.sections[1].title)
     # I know, I know, a lot of redundancy going on.
     self.row['talkpage'] = pagename
     self.log_val(url = self.url)
     self.row['chars'] = len(section)
     # List of dicts having keys vote, user
     self.votes = []
+    # List of dicts having keys ordinal, from_title, to_title, struck_title
+    self.moves = []
     # Mapping from usernames to dict counters of ocurrences of citations of policy (WP:FOO)
     self.user_to_policies = defaultdict(lambda: Counter())
     # A unique identifier for this RM. Used as a 'foreign key' for vote/pols data.
@@ -84,12 +122,54 @@ class RM(object):
       self.id = self.row['rm_link']
     self.row['id'] = self.id
     
-    self.parse()
+    with diagnostics.source(self.url):
+      self.parse()
+    if cols is not None:
+      keep = set(self.IDENTITY_COLS).union(cols)
+      self.row = {col: val for (col, val) in self.row.items() if col in keep}
+    if not votes:
+      self.votes = []
     
+  @classmethod
+  def wants_moves(cls, cols=None, moves=None):
+    """Resolve the moves argument of __init__ (or plan). None means moves are
+    wanted if all columns are, or any of NOM_COLS.
+    """
+    if moves is None:
+      return cols is None or not set(cols).isdisjoint(cls.NOM_COLS)
+    return moves
+
+  @classmethod
+  def plan(cls, cols=None, votes=True, pols=True, moves=None):
+    """Return (mrv, upto) for parsing an RM for the given columns (default:
+    all of COLS), with or without votes, pols and moves (see wants_moves).
+    mrv says whether we need to look for a move review, and upto how far
+    CommentExtractor needs to get (CLOSE, NOM or DISCUSSION), or 0 if it
+    needn't run at all.
+    """
+    moves = cls.wants_moves(cols, moves)
+    if cols is None:
+      cols = cls.COLS
+    cols = set(cols)
+    unknown = cols.difference(cls.COLS)
+    if unknown:
+      raise ValueError("Unknown columns: {}".format(', '.join(sorted(unknown))))
+    mrv = not cols.isdisjoint(cls.MRV_COLS)
+    if votes or pols or not cols.isdisjoint(cls.DISCUSSION_COLS):
+      upto = DISCUSSION
+    elif moves or not cols.isdisjoint(cls.NOM_COLS):
+      upto = NOM
+    elif not cols.isdisjoint(cls.CLOSE_COLS):
+      upto = CLOSE
+    else:
+      upto = 0
+    return mrv, upto
+
   def __str__(self):
+    # Rows parsed for only some columns may lack these
     return 'Requested Move: {} → {} {}'.format(
-      self.row['from_title'], self.row['to_title'],
-      self.row['nom_date'],
+      self.row.get('from_title'), self.row.get('to_title'),
+      self.row.get('nom_date'),
     )
   
   def __repr__(self):
@@ -101,16 +181,24 @@ class RM(object):
     suff = self.row['rm_link'].replace(' ', '_')
     return 'https://en.wikipedia.org/wiki/' + suff
   
+  def record(self, section_ix=None):
+    """Return an RMRecord of this RM, sharing none of its parsing state."""
+    user_to_policies = {user: dict(counts) for user, counts in self.user_to_policies.items()}
+    return RMRecord(self.id, self.row, self.votes, user_to_policies, self.moves,
+        section_ix)
+
   def dissect(self):
-    ordered_pairs = [(k, self.row[k]) for k in self.COLS]
+    ordered_pairs = [(k, self.row[k]) for k in self.COLS if k in self.row]
     pprint.pprint(ordered_pairs)
     print("#### Votes ####")
     pprint.pprint(self.votes)
     print("#### Polquotes ####")
     pprint.pprint(self.user_to_policies)
+    print("#### Moves ####")
+    pprint.pprint(self.moves)
     
   def set(self, k, v):
-    self.log('Setting {}={!r}'.format(k, v))
+    self.log('Setting {}={!r}', k, v)
     self.row[k] = v
     
   def setn(self, **kwargs):
@@ -123,29 +211,37 @@ class RM(object):
     # only count top-level discussions
     return sect[2] != '=' and RMTOP in sect
   
-  def log(self, msg):
+  def log(self, msg, *args):
+    """Print msg (formatted with args, if any) if in debug mode."""
     if self.debug:
-      print(msg)
+      print(msg.format(*args) if args else msg)
       
   def log_val(self, **kwargs):
+    if not self.debug:
+      return
     for k, v in kwargs.items():
-      msg = '{}={!r}'.format(k, v)
-      self.log(msg)
+      self.log('{}={!r}', k, v)
       
   def log2(self, **kwargs):
     if self.debug > 1:
       self.log_val(**kwargs)
   
-  def warn(self, msg):
-    msg += ' for {}'.format(self.url)
-    logging.warning(msg)
+  def warn(self, category, msg, *args):
+    diagnostics.warn(category, msg, *args)
   
   def parse(self):
-    self.check_mrv()
-    self.extracted = CommentExtractor(self.text)
+    if self.mrv_needed:
+      self.check_mrv()
+    if not self.upto:
+      return
+    with metrics.timer('extract'):
+      self.extracted = CommentExtractor(self.text, upto=self.upto)
     self.parse_close()
-    self.parse_nom(self.extracted.nom)
-    self.parse_discussion(self.extracted.comments)
+    if self.upto >= NOM:
+      self.parse_nom(self.extracted.nom)
+    if self.upto >= DISCUSSION:
+      with metrics.timer('discussion'):
+        self.parse_discussion(self.extracted.comments)
 
   def parse_nom(self, nom):
     """
@@ -167,8 +263,17 @@ class RM(object):
         all_froms='|'.join(map(str, froms)),
         all_tos='|'.join(map(str, tos)),
       )
+    if self.want_moves:
+      self.moves = [
+          dict(ordinal=i, from_title=frum, to_title=to, struck_title=struck)
+          for i, (frum, to, struck) in enumerate(zip(froms, tos, nom.struck_titles))
+      ]
     mainfrom = UNKNOWN if len(froms) == 0 else froms[0]
     mainto = UNKNOWN if len(tos) == 0 else tos[0]
+    if mainfrom == UNKNOWN:
+      metrics.incr('fallback.unknown_from')
+    if mainto == UNKNOWN:
+      metrics.incr('fallback.unknown_to')
     self.setn(
       nom_date=nom.timestamp,
       from_title=mainfrom,
@@ -176,9 +281,10 @@ class RM(object):
       n_relists=nom.relists,
     )
     nominator=nom.author
-    polcounts = nom.policy_counts()
-    if polcounts:
-      self.user_to_policies[nominator].update(polcounts)
+    if self.want_pols:
+      polcounts = nom.policy_counts()
+      if polcounts:
+        self.user_to_policies[nominator].update(polcounts)
     self.setn(nominator=nominator)
     
   def parse_discussion(self, comments):
@@ -186,7 +292,11 @@ class RM(object):
     """
     participants = {self.row['nominator']}
     n_comments = 0 # Don't count nom
-    for comment in comments:
+    if self.want_pols:
+      comment_polcounts = self.extracted.comment_policy_counts()
+    else:
+      comment_polcounts = [None] * len(comments)
+    for comment, polcounts in zip(comments, comment_polcounts):
       auth = comment.author
       participants.add(auth)
       n_comments += 1
@@ -197,7 +307,6 @@ class RM(object):
         comment=comment.text,
         vote=vote,
       )
-      polcounts = comment.policy_counts()
       if polcounts:
         self.user_to_policies[auth].update(polcounts)
         
@@ -215,18 +324,8 @@ class RM(object):
     the latter.
     """
     user_to_power_and_ix = {}
-    # TODO: add to this as more examples are observed
-    vote_kws = {'support', 'oppose', 'neutral', 'move', 'close'}
     for i, vote in enumerate(self.votes):
-      rec = vote['vote'].lower()
-      if rec == '':
-        power = 0
-      else:
-        if any(kw in rec for kw in vote_kws):
-          power = 2
-        else:
-          # For bold things not recognizable as reccs (e.g. '''Comment''')
-          power = 1
+      power = vote_power(vote['vote'])
       self.log_val(
         vote=vote,
         power=power
@@ -234,7 +333,7 @@ class RM(object):
       user = vote['user']
       bestpow, _ = user_to_power_and_ix.get(user, (-1, 0))
       if power > bestpow:
-        self.log('Updating best vote. pow {} > {}'.format(power, bestpow))
+        self.log('Updating best vote. pow {} > {}', power, bestpow)
         user_to_power_and_ix[user] = (power, i)
         
     newvotes = [self.votes[i] for (_, i) in user_to_power_and_ix.values()]
@@ -247,15 +346,15 @@ class RM(object):
         date_arg = template.get_arg('date')
         if date_arg:
           date_str = date_arg.value
-          self.set('mrv_date', dateparser.parse(date_str).date())
+          self.set('mrv_date', parse_date(date_str))
         else:
-          self.warn('MRV missing date arg: {}'.format(template.string))
+          self.warn('mrv_missing_date', 'MRV missing date arg: {}', template.string)
         result = template.get_arg('result')
         if result:
           res = result.value.strip()
         else:
           res = ''
-          self.warn('MRV missing result arg: {}'.format(template.string))
+          self.warn('mrv_missing_result', 'MRV missing result arg: {}', template.string)
         self.set('mrv_result', res)
         self.set('mrv', 1)
         return
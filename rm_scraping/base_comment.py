@@ -1,21 +1,44 @@
 import re
-import logging
-import dateparser
-import wikitextparser as wtp
-from collections import Counter
 
+import diagnostics
+import metrics
 from constants import *
+from timestamps import SIG_TIME_RE, parse_sig_time
+from policies import policy_counts
 from exceptions import *
 
+# Matches the target of a wikilink, i.e. everything between the opening brackets
+# and the first pipe or the closing brackets. Much cheaper than having
+# wikitextparser parse every comment just to find the user links in signatures.
+WIKILINK_TARGET_RE = re.compile(r'\[\[([^\[\]|\n]*)(?=\||\]\])')
+
+_UNSET = object()
+
+def cached_property(fn):
+  """Like property, but the value is computed on first access and stored in
+  the slot named '_' + the property's name. (Classes using this need to
+  declare those slots.)
+  """
+  slot = '_' + fn.__name__
+  def getter(self):
+    val = getattr(self, slot, _UNSET)
+    if val is _UNSET:
+      val = fn(self)
+      setattr(self, slot, val)
+    return val
+  getter.__doc__ = fn.__doc__
+  return property(getter)
+
 class BaseComment(object):
+  # RMs can have hundreds of these, so keep them small. Only the text is kept,
+  # plus any properties that have been computed.
+  __slots__ = ('text', '_author', '_timestamp', '_firstbold', '_indentation')
 
   def __init__(self, text):
     # Leading and trailing whitespace should be totally ignorable.
     # (Most common cause: leaving a space between the start of their
     # text and the previous comment)
     self.text = text.strip()
-    self.lines = self.text.split('\n')
-    self.parsed = wtp.parse(self.text)
 
   @property
   def extract(self):
@@ -44,8 +67,8 @@ class BaseComment(object):
         and 'Autosigned' not in line
         and 'Template:Unsigned' not in line
         ):
-      logging.warning("Unusual 'signature'(?) with (UTC) not at end:\n{!r}".format(
-        line))
+      diagnostics.warn('unusual_signature',
+          "Unusual 'signature'(?) with (UTC) not at end: {!r}", line)
     # Yes, the underscore version is attested. I hate people.
     return 'User:' in line or 'User talk:' in line or 'User_talk:' in line
 
@@ -57,13 +80,9 @@ class BaseComment(object):
       )
   
   def policy_counts(self):
-    rex = r'(?:MOS|WP):[A-Z]+'
-    counts = Counter()
-    for pol in re.findall(rex, self.text):
-      counts[pol] += 1
-    return counts
+    return policy_counts(self.text)
   
-  @property
+  @cached_property
   def indentation(self):
     ind = 0
     for char in self.text:
@@ -72,13 +91,11 @@ class BaseComment(object):
       else:
         return ind
     
-  # Cache this? Probably doesn't matter.
-  @property
+  @cached_property
   def author(self):
     # This should handle IP editors as well
     # Start from the end to account for pings etc.
-    for link in reversed(self.parsed.wikilinks):
-      t = link.target
+    for t in reversed(WIKILINK_TARGET_RE.findall(self.text)):
       if ':' not in t:
         continue
       col_ix = t.find(':')
@@ -90,20 +107,21 @@ class BaseComment(object):
           auth = auth[:auth.find('#')]
         return auth
       
-  @property
+  @cached_property
   def timestamp(self):
     # Example of non-standard time in signature:
     # https://en.wikipedia.org/wiki/Talk:KCLA_(Arkansas)#Defunct_radio_and_TV_station_disambiguator_changes_(consolidated)
     # Thanks a lot, Neutralhomer.
-    tm = re.search("\d{2}:\d{2}(?:,|(?: on)) (\d{1,2}) ([A-Za-z]*) (\d{4})", self.text)
+    tm = SIG_TIME_RE.search(self.text)
     if not tm:
-      logging.warning("Couldn't parse signature timestamp. Using dummytime. {!r}".format(
-        self.text[-200:]))
+      diagnostics.warn('dummytime',
+          "Couldn't parse signature timestamp. Using dummytime. {!r}", self.text[-200:])
+      metrics.incr('fallback.dummytime')
       return DUMMYTIME
     timestr = tm.group(0)
-    return dateparser.parse(timestr)
+    return parse_sig_time(timestr)
   
-  @property
+  @cached_property
   def firstbold(self):
     m = re.search("'''(.*?)'''", self.text, re.IGNORECASE)
     return m and m.group(1)
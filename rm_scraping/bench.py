@@ -0,0 +1,239 @@
+"""Benchmark each stage of RM parsing (comment extraction, nom, close, votes,
+policy citations, move review), and parsing for just some columns (see
+RM.plan), on the test fixtures, on scaled-up versions
+of them having their discussions repeated many times over, and on synthetic
+RMs of any size (see synth.py). Reports throughput and peak memory per stage.
+
+Results can be saved with --json, and compared against those from an earlier
+commit with --compare.
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import wikitextparser as wtp
+
+import timestamps
+from RM import RM
+from close import Close
+from comment import Comment
+from comment_extractor import CommentExtractor
+from nomination import Nomination
+from rm_loader import RMLoader, SHORTNAME_TO_SLINK
+from synth import synth_rms, parse_size
+
+def load_fixtures(loader):
+  """Return a list of (pagename, text) pairs for the test fixtures."""
+  texts = []
+  for shortname, slink in SHORTNAME_TO_SLINK.items():
+    pgname = slink.split('#')[0]
+    texts.append((pgname, loader.load_text_from_shortname(shortname)))
+  return texts
+
+def scale_rm(text, k):
+  """Return a version of the given RM text with its discussion (the comments
+  after the nom) repeated k times.
+  """
+  spans = CommentExtractor(text).comment_spans
+  if k == 1 or not spans:
+    return text
+  lines = text.split('\n')
+  first, last = spans[0][0], spans[-1][1]
+  return '\n'.join(lines[:first] + lines[first:last+1]*k + lines[last+1:])
+
+class Prepared(object):
+  """An RM's text, along with the outputs of earlier stages that later stages
+  take as input (computed up front, so they aren't included in the timings).
+  """
+
+  def __init__(self, pgname, text):
+    self.pgname = pgname
+    self.text = text
+    self.extracted = CommentExtractor(text)
+    self.comment_texts = [comment.text for comment in self.extracted.comments]
+
+def bare_rm(prep):
+  """Return an RM with just enough state set up to call its parse methods."""
+  rm = RM.__new__(RM)
+  rm.debug = 0
+  rm.text = prep.text
+  rm.row = RM.ROW_DEFAULTS.copy()
+  rm.row['rm_link'] = prep.pgname
+  rm.votes = []
+  return rm
+
+def stage_extract(prep):
+  CommentExtractor(prep.text)
+
+def stage_nom(prep):
+  nom = Nomination(prep.extracted.nom.text)
+  nom.author, nom.timestamp
+
+def stage_close(prep):
+  close = Close(prep.extracted.close.text)
+  close.author, close.timestamp, close.outcome
+
+def stage_votes(prep):
+  rm = bare_rm(prep)
+  for text in prep.comment_texts:
+    vote = Comment(text).get_vote()
+    if vote:
+      rm.votes.append(vote)
+  rm._merge_votes()
+
+def stage_policies(prep):
+  prep.extracted.nom.policy_counts()
+  prep.extracted.comment_policy_counts()
+
+def stage_mrv(prep):
+  rm = bare_rm(prep)
+  rm.parsed = wtp.parse(prep.text)
+  rm.check_mrv()
+
+def stage_total(prep):
+  RM(prep.text, prep.pgname)
+
+def stage_close_cols(prep):
+  RM(prep.text, prep.pgname, cols=RM.CLOSE_COLS, votes=False, pols=False)
+
+def stage_nom_cols(prep):
+  RM(prep.text, prep.pgname, cols=RM.NOM_COLS, votes=False, pols=False)
+
+STAGES = dict(
+    extract=stage_extract,
+    nom=stage_nom,
+    close=stage_close,
+    votes=stage_votes,
+    policies=stage_policies,
+    mrv=stage_mrv,
+    total=stage_total,
+    close_cols=stage_close_cols,
+    nom_cols=stage_nom_cols,
+)
+
+def clear_caches():
+  # Don't let memoization carry over between repetitions
+  timestamps.clear_caches()
+
+def time_stage(fn, preps, reps):
+  """Return the best time (in seconds) of reps runs of fn over preps."""
+  best = float('inf')
+  for _ in range(reps):
+    clear_caches()
+    t0 = time.perf_counter()
+    for prep in preps:
+      fn(prep)
+    best = min(best, time.perf_counter() - t0)
+  return best
+
+def peak_memory(fn, preps):
+  """Return the peak memory (in bytes) allocated during a run of fn over
+  preps. (Done separately from timing, since tracing slows things down a lot.)
+  """
+  clear_caches()
+  tracemalloc.start()
+  try:
+    for prep in preps:
+      fn(prep)
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return peak
+
+def bench_corpus(name, texts, stages, reps):
+  """Return a list of result dicts, one per stage, for the given corpus of
+  (pagename, text) pairs.
+  """
+  preps = [Prepared(pgname, text) for (pgname, text) in texts]
+  n_bytes = sum(len(text.encode('utf-8')) for (_, text) in texts)
+  results = []
+  for stage in stages:
+    fn = STAGES[stage]
+    secs = time_stage(fn, preps, reps)
+    results.append(dict(
+      corpus=name, stage=stage, n_rms=len(preps), bytes=n_bytes, seconds=secs,
+      rms_per_s=len(preps)/secs, bytes_per_s=n_bytes/secs,
+      peak_bytes=peak_memory(fn, preps),
+    ))
+    print_result(results[-1])
+  return results
+
+def print_result(res, old=None):
+  line = '{:16} {:10} {:>10.1f} {:>10.2f} {:>10.0f}'.format(
+      res['corpus'], res['stage'], res['rms_per_s'], res['bytes_per_s']/2**20,
+      res['peak_bytes']/2**10)
+  if old:
+    line += ' {:>8.2f}x'.format(old['seconds']/res['seconds'])
+  print(line)
+
+def print_header(compare=False):
+  header = '{:16} {:10} {:>10} {:>10} {:>10}'.format(
+      'corpus', 'stage', 'RMs/s', 'MB/s', 'peak KB')
+  if compare:
+    header += ' {:>9}'.format('speedup')
+  print(header)
+
+def git_commit():
+  try:
+    res = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+        capture_output=True, text=True, check=True)
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  return res.stdout.strip()
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--reps', type=int, default=3,
+      help='Number of runs of each stage. The best time is reported')
+  parser.add_argument('--scale', type=int, nargs='*', default=[1, 10],
+      help='Factors by which to scale up the discussions of the fixtures')
+  parser.add_argument('--synth', nargs='*', default=['100K'],
+      help='Sizes of synthetic RMs to benchmark (e.g. 1M 10M)')
+  parser.add_argument('--synth-n', type=int, default=3,
+      help='Number of synthetic RMs of each size')
+  parser.add_argument('--no-fixtures', action='store_true',
+      help='Only benchmark synthetic RMs')
+  parser.add_argument('--stages', nargs='*', choices=sorted(STAGES),
+      default=list(STAGES))
+  parser.add_argument('--json', help='Path to save results to')
+  parser.add_argument('--compare',
+      help='Path to results saved by an earlier run, to report speedups against')
+  args = parser.parse_args()
+
+  corpora = []
+  if not args.no_fixtures:
+    fixtures = load_fixtures(RMLoader())
+    for k in args.scale:
+      name = 'fixtures' if k == 1 else 'fixtures_x{}'.format(k)
+      corpora.append((name, [(pgname, scale_rm(text, k)) for (pgname, text) in fixtures]))
+  for size in args.synth:
+    corpora.append(('synth_{}'.format(size), synth_rms(args.synth_n, parse_size(size))))
+
+  results = []
+  print_header()
+  for name, texts in corpora:
+    results.extend(bench_corpus(name, texts, args.stages, args.reps))
+
+  if args.compare:
+    with open(args.compare) as f:
+      old = json.load(f)
+    old_results = {(res['corpus'], res['stage']): res for res in old['results']}
+    print("\nCompared to {} ({})".format(old.get('commit'), args.compare))
+    print_header(compare=True)
+    for res in results:
+      print_result(res, old_results.get((res['corpus'], res['stage'])))
+
+  if args.json:
+    out = dict(
+      commit=git_commit(),
+      time=datetime.datetime.now().isoformat(timespec='seconds'),
+      python=platform.python_version(),
+      reps=args.reps,
+      results=results,
+    )
+    with open(args.json, 'w') as f:
+      json.dump(out, f, indent=2)
@@ -0,0 +1,65 @@
+"""Compare the time to parse each of the test fixtures using our fixed-format
+timestamp parser vs. dateparser (which is what we used to call for every
+signature).
+"""
+import argparse
+import sys
+import time
+
+import dateparser
+
+import base_comment
+import timestamps
+from RM import RM
+from rm_loader import RMLoader, SHORTNAME_TO_SLINK
+
+def dateparser_sig_time(timestr):
+  return dateparser.parse(timestr)
+
+def dateparser_date(datestr):
+  return dateparser.parse(datestr).date()
+
+def use_dateparser(flag):
+  """Patch the modules that parse dates to use dateparser for everything (if
+  flag is True), or our fast, memoized parsers.
+  """
+  rm_module = sys.modules['RM']
+  if flag:
+    base_comment.parse_sig_time = dateparser_sig_time
+    rm_module.parse_date = dateparser_date
+  else:
+    base_comment.parse_sig_time = timestamps.parse_sig_time
+    rm_module.parse_date = timestamps.parse_date
+
+def time_per_rm(texts, reps):
+  t0 = time.perf_counter()
+  for _ in range(reps):
+    # Don't let memoization carry over between repetitions
+    timestamps.clear_caches()
+    for pgname, text in texts:
+      RM(text, pgname)
+  return (time.perf_counter() - t0) / reps
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--reps', type=int, default=3)
+  args = parser.parse_args()
+
+  loader = RMLoader()
+  texts = {}
+  for shortname, slink in SHORTNAME_TO_SLINK.items():
+    pgname = slink.split('#')[0]
+    texts[shortname] = (pgname, loader.load_text_from_shortname(shortname))
+
+  print('{:20} {:>10} {:>10} {:>8}'.format('fixture', 'dateparser', 'fast', 'speedup'))
+  totals = [0, 0]
+  for shortname, pair in texts.items():
+    times = []
+    for flag in (True, False):
+      use_dateparser(flag)
+      times.append(time_per_rm([pair], args.reps))
+    totals = [tot + t for (tot, t) in zip(totals, times)]
+    print('{:20} {:>9.1f}ms {:>9.1f}ms {:>7.1f}x'.format(
+      shortname, times[0]*1000, times[1]*1000, times[0]/times[1]))
+  print('{:20} {:>9.1f}ms {:>9.1f}ms {:>7.1f}x'.format(
+    'mean', totals[0]*1000/len(texts), totals[1]*1000/len(texts), totals[0]/totals[1]))
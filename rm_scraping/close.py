@@ -1,14 +1,16 @@
 import logging
 import re
 
-from base_comment import BaseComment
+from base_comment import BaseComment, cached_property
 from constants import *
 from exceptions import *
 
 class Close(BaseComment):
   """A closing comment.
   """
-  @property
+  __slots__ = ('_outcome',)
+
+  @cached_property
   def outcome(self):
     # First search for {{done}} or {{not done}} templates (see History of 
     # Palestine test case)
@@ -1,7 +1,7 @@
 import logging
 import re
 
-from base_comment import BaseComment
+from base_comment import BaseComment, _UNSET
 from constants import *
 from exceptions import *
 
@@ -13,8 +13,18 @@ class Comment(BaseComment):
     from the survey section). No bolded recc. Or bolded '''comment'''.
   - a reply to one of the above (or a reply to a reply to...)
   """
+  __slots__ = ('_vote',)
 
   def get_vote(self):
+    """Return a dict with keys user, vote, date describing this comment's !vote,
+    or None. Computed once.
+    """
+    vote = getattr(self, '_vote', _UNSET)
+    if vote is _UNSET:
+      vote = self._vote = self._get_vote()
+    return vote
+
+  def _get_vote(self):
     """Current heuristic is a little conservative. Will miss:
     - votes at indentation levels other than 1
     - votes that aren't bolded? (does that happen?)
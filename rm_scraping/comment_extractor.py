@@ -1,24 +1,70 @@
 import re
-import logging
+from array import array
+from bisect import bisect_right
+from collections import Counter
 
+import diagnostics
 from base_comment import BaseComment
 from comment import Comment
 from nomination import Nomination
 from close import Close
 from constants import *
+from policies import POLICY_RE
+
+# Flags for classifying lines
+BLANK = 1
+HLINE = 2
+HEADING = 4
+SIG = 8
+RMTOP_LINE = 16
+ARCHIVE_MSG = 32
+
+HEADING_RE = re.compile('==.*==')
+
+# Lines to leave out of the text of the close and nom, and of other comments
+SKIP_TOP = BLANK | HLINE
+SKIP_DISCUSSION = BLANK | HLINE | HEADING
+
+# How far through an RM to go. Each stage includes the ones before it.
+CLOSE = 1
+NOM = 2
+DISCUSSION = 3
+
+# Number of lines to classify at a time when stopping early
+CLASSIFY_CHUNK = 64
 
 class CommentExtractor(object):
   """Decomposes an RM into a bunch of Comment instances.
 
-  Okay, I guess I didn't really need a class for this, but whatever.
+  Each line is classified once, up front. The close, the nom and the remaining
+  comments are then located as ranges of lines, and a comment's text is only
+  built when it's needed (usually as a single slice of the section text).
+
+  If upto is CLOSE or NOM, we stop once we've found the close (or the nom),
+  and only the lines up to that point are classified. Attributes for later
+  stages are left unset (or, for comments, empty).
   """
 
-  def __init__(self, text):
+  def __init__(self, text, upto=DISCUSSION):
     self.text = text
     self.lines = self.text.split('\n')
-    self.comments = []
+    # Offset of the start of each line within text
+    self.starts = array('l', [0]) * len(self.lines)
+    offset = 0
+    for i, line in enumerate(self.lines):
+      self.starts[i] = offset
+      offset += len(line) + 1
+    self.flags = array('B', bytes(len(self.lines)))
+    self.i_rmtop = -1
+    # Lines before this one have been classified
+    self.n_classified = 0
+    if upto == DISCUSSION:
+      self.classify_lines()
+    # (first, last) line indices for each comment after the nom
+    self.comment_spans = []
+    self._comments = None
 
-    self.parse()
+    self.parse(upto)
 
   @staticmethod
   def matches_archivemsg(line):
@@ -28,9 +74,116 @@ class CommentExtractor(object):
     ]
     return any(phrase in line for phrase in phrases)
 
-  def parse(self):
-    i = 0
+  def classify_lines(self, end=None):
+    """Set the flags of lines up to (but not including) end (default: all of
+    them), carrying on from wherever the last call left off. self.i_rmtop is
+    set to the index of the first line having the RM top template (or -1).
+    Signatures are only looked for starting two lines after that.
+    """
+    lines = self.lines
+    n = len(lines)
+    end = n if end is None else min(end, n)
+    flags = self.flags
+    i_rmtop = self.i_rmtop
+    for i in range(self.n_classified, end):
+      line = lines[i]
+      if line == '':
+        flags[i] = BLANK
+        continue
+      if line == '----':
+        flags[i] = HLINE
+        continue
+      f = HEADING if HEADING_RE.match(line) else 0
+      if i_rmtop == -1:
+        if RMTOP in line:
+          f |= RMTOP_LINE
+          i_rmtop = i
+      else:
+        if i >= i_rmtop + 2 and BaseComment.has_signature(line):
+          f |= SIG
+        if self.matches_archivemsg(line):
+          f |= ARCHIVE_MSG
+      flags[i] = f
+    done = self.n_classified == n
+    self.n_classified = end
+    self.i_rmtop = i_rmtop
+    if i_rmtop == -1 and end == n and not done:
+      # Shouldn't happen. Treat everything after the first line as discussion.
+      for i, line in enumerate(lines):
+        if self.matches_archivemsg(line):
+          flags[i] |= ARCHIVE_MSG
+        if i >= 1 and BaseComment.has_signature(line):
+          flags[i] |= SIG
+
+  def find_rmtop(self):
+    """Classify lines until we've found the RM top template (or run out)."""
+    while self.i_rmtop == -1 and self.n_classified < len(self.lines):
+      self.classify_lines(self.n_classified + CLASSIFY_CHUNK)
+    # We'll want to look at the line after it
+    if self.n_classified < self.i_rmtop + 2:
+      self.classify_lines(self.i_rmtop + 2)
+
+  def next_sig(self, i):
+    """Return the index of the first line from i onwards having a signature,
+    or the number of lines if there isn't one, classifying lines as needed.
+    """
+    n = len(self.lines)
+    flags = self.flags
+    while i < n:
+      if i >= self.n_classified:
+        self.classify_lines(i + CLASSIFY_CHUNK)
+      if flags[i] & SIG:
+        return i
+      i += 1
+    return n
+
+  def included_lines(self, first, last, skip):
+    return [i for i in range(first, last+1) if not self.flags[i] & skip]
+
+  def span_text(self, first, last, skip):
+    """Return the text of lines first through last (inclusive), leaving out any
+    lines having any of the flags in skip.
+    """
+    ixs = self.included_lines(first, last, skip)
+    if not ixs:
+      return ''
+    a, b = ixs[0], ixs[-1]
+    if b - a + 1 == len(ixs):
+      return self.text[self.starts[a]:self.starts[b] + len(self.lines[b])]
+    return '\n'.join(self.lines[i] for i in ixs)
+
+  def comment_policy_counts(self):
+    """Return a list of Counters of policy citations, one for each comment, found
+    with a single scan over the discussion.
+    """
+    spans = self.comment_spans
+    counts = [Counter() for _ in spans]
+    if not spans:
+      return counts
+    firsts = [first for (first, _) in spans]
+    start = self.starts[firsts[0]]
+    end = self.starts[spans[-1][1]] + len(self.lines[spans[-1][1]])
+    for m in POLICY_RE.finditer(self.text, start, end):
+      i = bisect_right(self.starts, m.start()) - 1
+      if self.flags[i] & SKIP_DISCUSSION:
+        continue
+      k = bisect_right(firsts, i) - 1
+      if i <= spans[k][1]:
+        counts[k][m.group()] += 1
+    return counts
+
+  @property
+  def comments(self):
+    if self._comments is None:
+      self._comments = [Comment(self.span_text(first, last, SKIP_DISCUSSION))
+          for (first, last) in self.comment_spans]
+    return self._comments
+
+  def parse(self, upto=DISCUSSION):
+    self.find_rmtop()
     lines = self.lines
+    flags = self.flags
+    n = len(lines)
     # Typical layout of top matter:
     # <div class="boilerplate" .... Template:RM top -->
     # :''The following is an archive discussion...
@@ -40,69 +193,52 @@ class CommentExtractor(object):
     # blank line
     # nom
     # ... but the blank lines and hlines are more or less optional
-    i_rmtop = -1
-    i_archive_msg = -1
-    a_close = -1
-    b_close = -1
-    while i < len(lines):
-      line = lines[i]
-      if '<!-- Template:RM top -->' in line:
-        i_rmtop = i
-        break
-      i += 1
+    i_rmtop = self.i_rmtop
     arch = lines[i_rmtop+1]
-    if not self.matches_archivemsg(arch):
-      logging.warning("Line immediately following RM top doesn't look like"
-          "archive msg: {!r}".format(arch[:400]))
-      
-    i = i_rmtop+2
-    acc = []
-    # Postcondition: self.close is set, and i is idx of last line of close
-    while i < len(lines):
-      line = lines[i]
-      if line != '' and line != '----':
-        acc.append(line)
-
-      if BaseComment.has_signature(line):
-        if len(acc) != 1:
-          logging.warning("Got >1 line for closing comment: {!r}".format(
-            [accline[:200] for accline in acc]))
-        close_txt = '\n'.join(acc)
-        self.close = Close(close_txt)
-        break
+    if not flags[i_rmtop+1] & ARCHIVE_MSG:
+      diagnostics.warn('no_archive_msg',
+          "Line immediately following RM top doesn't look like archive msg: {!r:.400}",
+          arch)
 
-      i += 1
+    first = i_rmtop+2
+    # Postcondition: self.close is set, and i is idx of last line of close
+    i = self.next_sig(first)
+    if i < n:
+      close_text = self.span_text(first, i, SKIP_TOP)
+      if '\n' in close_text:
+        diagnostics.warn('multiline_close',
+            "Got >1 line for closing comment: {!r:.400}", close_text)
+      self.close = Close(close_text)
+    if upto == CLOSE:
+      return
 
     # Get nom comment (absorbing any intervening comments from closer)
     i += 1 # Advance to first line after close
-    acc = []
-    while i < len(lines):
-      line = lines[i]
-      if line != '' and line != '----':
-        acc.append(line)
-      if BaseComment.has_signature(line):
-        nom_text = '\n'.join(acc)
-        # Bit of a hack
-        test_comm = BaseComment(nom_text)
-        # If this is a comment by the closer, it's not the nom. *UNLESS the
-        # nominator is withdrawing*. If there's a rarrow in the text, let's
-        # assume it is the latter case.
-        if test_comm.author == self.close.author and RARROW not in nom_text:
-          acc = []
-        else:
-          self.nom = Nomination(nom_text)
-          break
-
+    first = i
+    while i < n:
+      i = self.next_sig(i)
+      if i == n:
+        break
+      nom_text = self.span_text(first, i, SKIP_TOP)
+      # Bit of a hack
+      test_comm = BaseComment(nom_text)
+      # If this is a comment by the closer, it's not the nom. *UNLESS the
+      # nominator is withdrawing*. If there's a rarrow in the text, let's
+      # assume it is the latter case.
+      if test_comm.author == self.close.author and RARROW not in nom_text:
+        first = i + 1
+      else:
+        self.nom = Nomination(nom_text)
+        break
       i += 1
+    if upto == NOM:
+      return
     # Postcondition: close and nom are set. i is idx of last line of nom.
-    # Everything after this should be a comment.
-    acc = []
-    for line in lines[i+1:]:
-      # For simplicity, ignore section headings, hlines, and blank lines.
-      if line != '' and line != '----' and not re.match('==.*==', line):
-        acc.append(line)
-      if BaseComment.has_signature(line):
-        text = '\n'.join(acc)
-        c = Comment(text)
-        self.comments.append(c)
-        acc = []
+    # Everything after this should be a comment. (For simplicity, we ignore
+    # section headings, hlines, and blank lines.)
+    self.classify_lines()
+    first = i + 1
+    for j in range(i+1, n):
+      if flags[j] & SIG:
+        self.comment_spans.append((first, j))
+        first = j + 1
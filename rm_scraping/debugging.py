@@ -2,8 +2,12 @@ import sys
 from pprint import pprint
 import argparse
 
+import diagnostics
 from rm_loader import RMLoader
 
+# Show warnings about the RM as they happen
+diagnostics.set_level('log')
+
 loader = RMLoader(
     rm_kwargs=dict(debug=1)
 )
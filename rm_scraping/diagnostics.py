@@ -0,0 +1,104 @@
+"""Warnings about unusual things encountered while parsing RMs (weird
+signatures, missing archive messages, noms with no → lines, ...).
+
+Rather than logging each one as it happens, warnings are aggregated by
+category, keeping a count and a few samples (with the URL of the RM they came
+from), and summarised at the end of a run. Messages are only formatted when
+they're kept as a sample or logged, so warnings in hot paths cost little more
+than a dict lookup. LEVEL controls what happens to them:
+
+- OFF: ignored entirely
+- SUMMARY: aggregated (the default)
+- LOG: aggregated, and also logged immediately (the old behaviour, useful
+  when debugging a single RM)
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+OFF = 0
+SUMMARY = 1
+LOG = 2
+LEVELS = dict(off=OFF, summary=SUMMARY, log=LOG)
+
+LEVEL = SUMMARY
+
+class Diagnostics(object):
+  """Counts and samples of warnings, by category."""
+
+  def __init__(self, max_samples=3):
+    self.max_samples = max_samples
+    self.lock = threading.Lock()
+    self.counts = {}
+    # category -> list of (url, message)
+    self.samples = {}
+    # URL of the RM currently being parsed
+    self.url = None
+
+  def record(self, category, fmt, args, log=False):
+    with self.lock:
+      n = self.counts[category] = self.counts.get(category, 0) + 1
+      samples = self.samples.setdefault(category, [])
+      keep = len(samples) < self.max_samples
+      if keep or log:
+        msg = fmt.format(*args)
+      if keep:
+        samples.append((self.url, msg))
+    if log:
+      logging.warning('{} for {}'.format(msg, self.url))
+
+  @contextmanager
+  def source(self, url):
+    """Attribute warnings recorded within this context to the given URL."""
+    prev = self.url
+    self.url = url
+    try:
+      yield
+    finally:
+      self.url = prev
+
+  def take(self):
+    """Return the counts and samples recorded so far, and reset them."""
+    with self.lock:
+      delta = (self.counts, self.samples)
+      self.counts = {}
+      self.samples = {}
+    return delta
+
+  def merge(self, delta):
+    """Add in counts and samples returned by take (e.g. in another process)."""
+    counts, samples = delta
+    with self.lock:
+      for category, n in counts.items():
+        self.counts[category] = self.counts.get(category, 0) + n
+      for category, new in samples.items():
+        mine = self.samples.setdefault(category, [])
+        mine.extend(new[:self.max_samples - len(mine)])
+
+  def summary(self):
+    """Return a human-readable summary of everything recorded."""
+    if not self.counts:
+      return 'No warnings'
+    lines = ['Warnings:']
+    for category in sorted(self.counts, key=self.counts.get, reverse=True):
+      lines.append('  {:>8}  {}'.format(self.counts[category], category))
+      for url, msg in self.samples.get(category, []):
+        lines.append('            {}'.format(url))
+        lines.append('              {}'.format(msg[:300]))
+    return '\n'.join(lines)
+
+DIAGNOSTICS = Diagnostics()
+
+def warn(category, fmt, *args):
+  """Record a warning of the given category. The message is fmt.format(*args),
+  which is only computed if needed.
+  """
+  if LEVEL:
+    DIAGNOSTICS.record(category, fmt, args, log=LEVEL >= LOG)
+
+def source(url):
+  return DIAGNOSTICS.source(url)
+
+def set_level(name):
+  global LEVEL
+  LEVEL = LEVELS[name]
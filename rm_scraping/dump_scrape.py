@@ -0,0 +1,215 @@
+"""Scrape RMs from a MediaWiki XML dump (e.g. enwiki-latest-pages-meta-current.xml.bz2)
+rather than the live API. Writes the same csv files as scrape.py.
+
+With a multistream dump and its index file, the dump is split into its
+independent bz2 streams, which are decompressed and parsed by a pool of workers.
+"""
+import argparse
+import bz2
+import io
+import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+
+import diagnostics
+import metrics
+import scrape
+from scrape import (parse_rm_sections, parse_pipelined, parse_section, place_record,
+    record_failure, take_worker_stats, merge_worker_stats)
+from RM import RM
+from constants import *
+from sections import split_sections
+from sinks import open_sink, SINKS
+from shortcut_cache import ShortcutCache, DEFAULT_PATH as SHORTCUT_CACHE
+from utils import chunked
+
+TALK_NS = 1
+# Number of streams to hand to a worker at a time
+STREAMS_PER_TASK = 8
+
+def localname(tag):
+  return tag.rsplit('}', 1)[-1]
+
+def iter_dump_pages(f):
+  """Yield (title, ns, text) for each page in the given xml file object (with
+  the text of the last revision given for the page). Elements are discarded
+  as soon as they've been read, so memory use doesn't grow with the dump size.
+  """
+  root = None
+  for event, elem in ET.iterparse(f, events=('start', 'end')):
+    if root is None:
+      root = elem
+    if event != 'end' or localname(elem.tag) != 'page':
+      continue
+    title = ns = text = None
+    for child in elem:
+      name = localname(child.tag)
+      if name == 'title':
+        title = child.text
+      elif name == 'ns':
+        ns = int(child.text)
+      elif name == 'revision':
+        for revchild in child:
+          if localname(revchild.tag) == 'text':
+            text = revchild.text or ''
+    yield title, ns, text
+    root.clear()
+
+def iter_rm_pages(f, skip=frozenset()):
+  """Yield (title, sections) pairs for talk pages in the given dump file object
+  having at least one RM, where sections is a list of (section_ix, text) pairs.
+  Pages with titles in skip are ignored.
+  """
+  for title, ns, text in iter_dump_pages(f):
+    if ns != TALK_NS or not text or RMTOP not in text or title in skip:
+      continue
+    sections = [(s.index, s.text) for s in split_sections(text)
+        if RM.section_is_rm(s.text)]
+    if sections:
+      yield title, sections
+
+def open_dump(path):
+  if path.endswith('.bz2'):
+    # bz2.open handles concatenated streams, so this also works for multistream dumps
+    return bz2.open(path, 'rb')
+  return open(path, 'rb')
+
+def read_stream_offsets(index_path):
+  """Return the sorted, distinct stream offsets listed in a multistream index
+  file. Each line has the form offset:page_id:title
+  """
+  opener = bz2.open if index_path.endswith('.bz2') else open
+  offsets = set()
+  with opener(index_path, 'rt', encoding='utf-8') as f:
+    for line in f:
+      offsets.add(int(line[:line.index(':')]))
+  return sorted(offsets)
+
+def iter_stream_ranges(offsets, dump_size):
+  """Yield (start, end) byte ranges for the streams starting at each offset."""
+  for start, end in zip(offsets, offsets[1:] + [dump_size]):
+    yield start, end
+
+def read_stream_pages(path, start, end):
+  """Decompress the bz2 stream occupying the given byte range of a multistream
+  dump, and return it as a file object containing a well-formed xml document.
+  """
+  with open(path, 'rb') as f:
+    f.seek(start)
+    raw = f.read(end - start)
+  xml = bz2.decompress(raw)
+  # Streams hold a bare sequence of <page> elements. The last one also closes
+  # the <mediawiki> element opened in the first (header) stream.
+  xml = xml.replace(b'</mediawiki>', b'')
+  return io.BytesIO(b'<pages>' + xml + b'</pages>')
+
+# Titles of pages to ignore. Set in each worker by init_worker.
+SKIP = frozenset()
+
+def init_worker(skip):
+  global SKIP
+  SKIP = skip
+
+def scrape_streams(task):
+  """Worker function. Parse the RMs in the given byte ranges of a multistream
+  dump. Returns a list of (title, section_ix, RMRecord, exception) tuples, with
+  exactly one of the last two being non-None, and the metrics and diagnostics
+  recorded while parsing them.
+  """
+  path, ranges = task
+  results = []
+  for start, end in ranges:
+    f = read_stream_pages(path, start, end)
+    for title, sections in iter_rm_pages(f, SKIP):
+      for section_ix, section in sections:
+        try:
+          record = parse_section(section, title)
+        except Exception as e:
+          results.append((title, section_ix, None, e))
+        else:
+          results.append((title, section_ix, record, None))
+  return results, take_worker_stats()
+
+def scrape_multistream(path, index_path, n_workers, f_fail, skip=frozenset()):
+  """Yield RMRecords (with ids assigned in dump order) from a multistream dump."""
+  offsets = read_stream_offsets(index_path)
+  with open(path, 'rb') as f:
+    dump_size = f.seek(0, io.SEEK_END)
+  tasks = ((path, ranges) for ranges in
+      chunked(iter_stream_ranges(offsets, dump_size), STREAMS_PER_TASK))
+  with Pool(n_workers, initializer=init_worker, initargs=(skip,)) as pool:
+    for results, stats in pool.imap(scrape_streams, tasks):
+      merge_worker_stats(stats)
+      for title, section_ix, record, e in results:
+        if e is not None:
+          record_failure(f_fail, title, section_ix, e)
+          continue
+        yield place_record(title, section_ix, record)
+
+def scrape_dump(path, n_workers, f_fail, skip=frozenset()):
+  """Yield RMRecords from a dump read as a single stream."""
+  pages = iter_rm_pages(open_dump(path), skip)
+  if n_workers:
+    parsed = parse_pipelined(pages, n_workers, f_fail)
+  else:
+    parsed = ((title, parse_rm_sections(title, sections, f_fail))
+        for (title, sections) in pages)
+  for title, rms in parsed:
+    yield from rms
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('dump', help='Path to xml dump (optionally bz2-compressed)')
+  parser.add_argument('--index',
+      help='Index file for a multistream dump. If given, streams are processed in parallel')
+  parser.add_argument('-j', '--workers', type=int, default=0,
+      help='Number of worker processes. If 0, parse in the main process')
+  parser.add_argument('-c', '--clobber', action='store_true', help='Overwrite existing output files')
+  parser.add_argument('-o', '--output', choices=sorted(SINKS), default='csv',
+      help='Output format')
+  parser.add_argument('--canon', nargs='?', const=SHORTCUT_CACHE, metavar='CACHE',
+      help='Add a canon column to the pols table, giving the canonical form of '
+      'each shortcut according to the cache kept by resolve_shortcuts.py '
+      '(default: {})'.format(SHORTCUT_CACHE))
+  parser.add_argument('--metrics', default='metrics.jsonl',
+      help='File to append periodic snapshots of timers and counters to (as json lines)')
+  parser.add_argument('--warnings', choices=sorted(diagnostics.LEVELS), default='summary',
+      help='What to do with warnings about unusual RMs: nothing, summarise them '
+      'at the end, or also log them as they happen')
+  args = parser.parse_args()
+  metrics.METRICS.open_snapshots(args.metrics)
+  diagnostics.set_level(args.warnings)
+
+  sink = open_sink(args.output, clobber=args.clobber,
+      canon=ShortcutCache(args.canon).canon_map() if args.canon else None)
+  scrape.NEXT_ID = sink.next_id
+  f_fail = open('failures.tsv', 'w' if sink.fresh else 'a')
+  if args.index:
+    rms_iter = scrape_multistream(args.dump, args.index, args.workers or 1, f_fail,
+        skip=sink.extant_pages)
+  else:
+    rms_iter = scrape_dump(args.dump, args.workers, f_fail, skip=sink.extant_pages)
+
+  rms = []
+  i_rm = 0
+  for rm in rms_iter:
+    rms.append(rm)
+    i_rm += 1
+    if len(rms) >= scrape.FLUSH_EVERY:
+      with metrics.timer('flush'):
+        sink.write(rms)
+        sink.sync()
+      rms = []
+    metrics.METRICS.maybe_snapshot()
+    if i_rm % 1000 == 0:
+      print("i_rm = {}".format(i_rm))
+  if rms:
+    with metrics.timer('flush'):
+      sink.write(rms)
+      sink.sync()
+
+  sink.close()
+  f_fail.close()
+  print("Wrote {} RMs".format(i_rm))
+  metrics.METRICS.close()
+  print(metrics.METRICS.summary())
+  print(diagnostics.DIAGNOSTICS.summary())
@@ -1,3 +1,9 @@
 
 class FatalParsingException(Exception):
   pass
+
+class SectionNotFound(Exception):
+  pass
+
+class OfflineError(Exception):
+  pass
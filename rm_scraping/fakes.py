@@ -0,0 +1,15 @@
+"""Builders of RMRecords for tests."""
+from RM import RMRecord
+
+def fake_record(id, talkpage, section_ix=None, votes=(), pols=None, moves=(), **row):
+  """Return an RMRecord with the given id, for an RM on talkpage. votes is a
+  list of dicts, pols a dict mapping users to Counters of shortcuts, and moves a
+  list of (from_title, to_title, struck_title) triples. Any other keyword
+  arguments are added to the row.
+  """
+  id = str(id)
+  row = dict(row, id=id, talkpage=talkpage, rm_link=talkpage + '#RM',
+      article=talkpage[len('Talk:'):])
+  moves = [dict(ordinal=i, from_title=frum, to_title=to, struck_title=struck)
+      for i, (frum, to, struck) in enumerate(moves)]
+  return RMRecord(id, row, list(votes), dict(pols or {}), moves, section_ix)
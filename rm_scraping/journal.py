@@ -0,0 +1,132 @@
+import os
+
+class Journal(object):
+  """Append-only, fsync'd record of what happened to each RM section we've
+  parsed, so an interrupted scrape can resume exactly where it left off.
+
+  Each line of the tsv is (title, section_ix, status, rm_id), where status is
+  one of:
+  - start: we began a full (re)scrape of the page (section_ix and rm_id empty)
+  - ok: the RM parsed from the section was written with the given id
+  - failed: the section couldn't be parsed
+  - done: all of the page's sections have been dealt with (section_ix and
+    rm_id empty)
+  For any section, the latest line takes precedence.
+
+  Pages with a start line but no done line since are 'partial'. Resuming one
+  (see filter_sections) assumes its sections are numbered the same as when it
+  was started.
+  """
+  START = 'start'
+  OK = 'ok'
+  FAILED = 'failed'
+  DONE = 'done'
+
+  def __init__(self, path='journal.tsv', clobber=False):
+    self.path = path
+    # title -> {section_ix: (status, rm_id)}, for the latest pass over each page
+    self.sections = {}
+    # Pages started but not done
+    self.partial = set()
+    self.done_pages = set()
+    # Pages having sections which failed on their latest attempt
+    self.failed_pages = set()
+    # Pages which we're resuming on this run
+    self.resumed = set()
+    if clobber and os.path.exists(path):
+      os.remove(path)
+    self._recover()
+    self.f = open(path, 'a', encoding='utf-8')
+
+  def _recover(self):
+    try:
+      f = open(self.path, 'rb')
+    except FileNotFoundError:
+      return
+    with f:
+      data = f.read()
+    # Ignore (and cut off) any torn line at the end, left by a crash mid-write
+    valid = data.rfind(b'\n') + 1
+    if valid < len(data):
+      with open(self.path, 'r+b') as f:
+        f.truncate(valid)
+    pages = self.sections
+    for line in data[:valid].decode('utf-8').splitlines():
+      title, section_ix, status, rm_id = line.split('\t')
+      if status == self.START:
+        pages[title] = {}
+        self.done_pages.discard(title)
+      elif status == self.DONE:
+        self.done_pages.add(title)
+      else:
+        pages.setdefault(title, {})[int(section_ix)] = (status, rm_id)
+    for title, sections in pages.items():
+      if any(status == self.FAILED for status, _ in sections.values()):
+        self.failed_pages.add(title)
+      if title not in self.done_pages:
+        self.partial.add(title)
+
+  def is_partial(self, title):
+    return title in self.partial
+
+  def written_ids(self, title):
+    """Return the ids of the RMs written for the given page on its latest pass."""
+    return {rm_id for status, rm_id in self.sections.get(title, {}).values()
+        if status == self.OK}
+
+  def filter_sections(self, title, sections, retry_failures=False):
+    """Given the (section_ix, text) pairs of a page we're about to parse,
+    return those which still need parsing. If the page is partial (or,
+    given retry_failures, has failed sections), we resume it, and that means
+    any sections not yet written (or which failed). Otherwise, it's a fresh
+    start and all of them.
+    """
+    if not (title in self.partial or (retry_failures and title in self.failed_pages)):
+      self.start(title)
+      return sections
+    self.resumed.add(title)
+    statuses = self.sections[title]
+    pending = []
+    for section_ix, text in sections:
+      status, _ = statuses.get(section_ix, (None, None))
+      if status == self.OK or (status == self.FAILED and not retry_failures):
+        continue
+      pending.append((section_ix, text))
+    return pending
+
+  def _write(self, title, section_ix, status, rm_id):
+    self.f.write('{}\t{}\t{}\t{}\n'.format(title, section_ix, status, rm_id))
+
+  def start(self, title):
+    self.sections[title] = {}
+    self.partial.add(title)
+    self.done_pages.discard(title)
+    self._write(title, '', self.START, '')
+
+  def failed(self, title, section_ix):
+    self.sections.setdefault(title, {})[section_ix] = (self.FAILED, '')
+    self.failed_pages.add(title)
+    self._write(title, section_ix, self.FAILED, '')
+    self.sync()
+
+  def written(self, rms, pages):
+    """Record that the given RMRecords (with their section_ix set), and
+    the given pages, have been written out. Call after the sink has synced.
+    """
+    for rm in rms:
+      title = rm.row['talkpage']
+      self.sections.setdefault(title, {})[rm.section_ix] = (self.OK, rm.id)
+      self._write(title, rm.section_ix, self.OK, rm.id)
+    for title in pages:
+      self.partial.discard(title)
+      self.done_pages.add(title)
+      self._write(title, '', self.DONE, '')
+    self.sync()
+
+  def sync(self):
+    self.f.flush()
+    os.fsync(self.f.fileno())
+
+  def close(self):
+    self.sync()
+    self.f.close()
@@ -0,0 +1,141 @@
+"""Counters and timers describing where a scrape run spends its time, and how
+often the parsing heuristics have to fall back on something (dummy timestamps,
+unknown titles, etc.).
+
+Everything is recorded in a single process-wide Metrics instance through the
+module-level functions incr, timer and timed. Worker processes send theirs back
+to the main process with take, to be added in with merge.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+class Metrics(object):
+  """Named counters, and named timers accumulating a number of calls and total
+  seconds. Safe to update from multiple threads.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.counts = Counter()
+    self.calls = Counter()
+    self.seconds = Counter()
+    self.start = time.time()
+    # If set, a file to which snapshots are written as json lines
+    self.f_snapshots = None
+    self.snapshot_every = 30
+    self.last_snapshot = 0
+
+  def incr(self, name, n=1):
+    with self.lock:
+      self.counts[name] += n
+
+  def add_time(self, name, seconds, calls=1):
+    with self.lock:
+      self.calls[name] += calls
+      self.seconds[name] += seconds
+
+  @contextmanager
+  def timer(self, name):
+    t0 = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add_time(name, time.perf_counter() - t0)
+
+  def timed_iter(self, name, it):
+    """Yield from the given iterator, timing each step (e.g. to measure time
+    spent waiting on a paged API query).
+    """
+    it = iter(it)
+    while 1:
+      t0 = time.perf_counter()
+      try:
+        item = next(it)
+      except StopIteration:
+        return
+      finally:
+        self.add_time(name, time.perf_counter() - t0)
+      yield item
+
+  def take(self):
+    """Return the counts and timings recorded so far, and reset them."""
+    with self.lock:
+      delta = (dict(self.counts), dict(self.calls), dict(self.seconds))
+      self.counts.clear()
+      self.calls.clear()
+      self.seconds.clear()
+    return delta
+
+  def merge(self, delta):
+    """Add in counts and timings returned by take (e.g. in another process)."""
+    counts, calls, seconds = delta
+    with self.lock:
+      self.counts.update(counts)
+      self.calls.update(calls)
+      self.seconds.update(seconds)
+
+  def snapshot(self):
+    with self.lock:
+      return dict(
+        time=time.time(),
+        elapsed=time.time() - self.start,
+        counts=dict(self.counts),
+        timers={name: dict(calls=self.calls[name], seconds=self.seconds[name])
+          for name in sorted(self.calls)},
+      )
+
+  def open_snapshots(self, path, every=30):
+    """Start appending a snapshot to the given file (as a line of json) at
+    most once every `every` seconds, whenever maybe_snapshot is called.
+    """
+    self.f_snapshots = open(path, 'a')
+    self.snapshot_every = every
+
+  def write_snapshot(self):
+    self.last_snapshot = time.time()
+    self.f_snapshots.write(json.dumps(self.snapshot()) + '\n')
+    self.f_snapshots.flush()
+
+  def maybe_snapshot(self):
+    if (self.f_snapshots is not None
+        and time.time() - self.last_snapshot >= self.snapshot_every):
+      self.write_snapshot()
+
+  def close(self):
+    if self.f_snapshots is not None:
+      self.write_snapshot()
+      self.f_snapshots.close()
+      self.f_snapshots = None
+
+  def summary(self):
+    """Return a human-readable summary of everything recorded."""
+    lines = ['Timers:']
+    for name in sorted(self.seconds, key=self.seconds.get, reverse=True):
+      lines.append('  {:24} {:>10.2f}s {:>10} calls'.format(
+        name, self.seconds[name], self.calls[name]))
+    lines.append('Counts:')
+    for name in sorted(self.counts):
+      lines.append('  {:24} {:>10}'.format(name, self.counts[name]))
+    return '\n'.join(lines)
+
+METRICS = Metrics()
+
+def incr(name, n=1):
+  METRICS.incr(name, n)
+
+def timer(name):
+  return METRICS.timer(name)
+
+def timed(name):
+  """Decorator which times every call of the decorated function."""
+  def decorator(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+      with METRICS.timer(name):
+        return fn(*args, **kwargs)
+    return wrapper
+  return decorator
@@ -0,0 +1,100 @@
+"""Index of the RMs proposing to move each title, built from the moves table
+(moves.csv, or the moves table of rms.db), for fast lookups of e.g. all RMs
+that ever proposed moving a given article.
+
+Run as a script to list the RMs for a title.
+"""
+import argparse
+import csv
+import sqlite3
+
+def title_key(title):
+  """Normalise a title the way MediaWiki does: underscores are spaces, runs of
+  whitespace are collapsed, and the first letter is case-insensitive.
+  """
+  title = ' '.join(title.replace('_', ' ').split())
+  return title[:1].upper() + title[1:]
+
+class MoveIndex(object):
+  """Maps titles to the ids of the RMs proposing to move them (from_title), and
+  of the RMs proposing to move something to them (to_title, including titles
+  proposed and then struck through).
+  """
+
+  def __init__(self):
+    self.by_from = {}
+    self.by_to = {}
+
+  def add(self, rm_id, from_title, to_title, struck_title=None):
+    if from_title:
+      self.by_from.setdefault(title_key(from_title), []).append(rm_id)
+    for title in (to_title, struck_title):
+      if title:
+        self.by_to.setdefault(title_key(title), []).append(rm_id)
+
+  @classmethod
+  def from_csv(cls, path='moves.csv'):
+    index = cls()
+    with open(path, newline='') as f:
+      for row in csv.DictReader(f):
+        index.add(row['rm_id'], row['from_title'], row['to_title'], row['struck_title'])
+    return index
+
+  @classmethod
+  def from_sqlite(cls, path='rms.db'):
+    index = cls()
+    db = sqlite3.connect(path)
+    try:
+      rows = db.execute('SELECT rm_id, from_title, to_title, struck_title FROM moves')
+      for rm_id, from_title, to_title, struck_title in rows:
+        index.add(str(rm_id), from_title, to_title, struck_title)
+    finally:
+      db.close()
+    return index
+
+  @staticmethod
+  def _lookup(ids_by_title, title):
+    # An RM can list the same title more than once
+    return list(dict.fromkeys(ids_by_title.get(title_key(title), [])))
+
+  def rms_from(self, title):
+    """Return the ids of RMs proposing to move the given title, in order."""
+    return self._lookup(self.by_from, title)
+
+  def rms_to(self, title):
+    """Return the ids of RMs proposing to move something to the given title."""
+    return self._lookup(self.by_to, title)
+
+def rm_links(ids, db=None):
+  """Return a dict mapping the given RM ids to their rm_links, from rms.csv (or
+  the given sqlite database).
+  """
+  ids = set(ids)
+  if db is not None:
+    conn = sqlite3.connect(db)
+    try:
+      return {str(id): link for (id, link) in
+          conn.execute('SELECT id, rm_link FROM rms') if str(id) in ids}
+    finally:
+      conn.close()
+  with open('rms.csv', newline='') as f:
+    return {row['id']: row['rm_link'] for row in csv.DictReader(f) if row['id'] in ids}
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('titles', nargs='+', help='Article titles to look up')
+  parser.add_argument('--db', nargs='?', const='rms.db', metavar='PATH',
+      help='Read from an sqlite database written by scrape.py --output sqlite '
+      '(default: rms.db), rather than moves.csv and rms.csv')
+  args = parser.parse_args()
+  if args.db:
+    index = MoveIndex.from_sqlite(args.db)
+  else:
+    index = MoveIndex.from_csv()
+  found = {title: (index.rms_from(title), index.rms_to(title)) for title in args.titles}
+  links = rm_links((id for pair in found.values() for ids in pair for id in ids), args.db)
+  for title, (froms, tos) in found.items():
+    print(title)
+    for role, ids in [('from', froms), ('to', tos)]:
+      for id in ids:
+        print('  {}\t{}\t{}'.format(role, id, links.get(id, '?')))
@@ -1,13 +1,16 @@
-import logging
 import re
 
+import diagnostics
+import metrics
 from base_comment import BaseComment
 from constants import *
 from exceptions import *
 
 class Nomination(BaseComment):
+  __slots__ = ('relists', 'from_titles', 'to_titles', 'struck_titles')
+
   def __init__(self, text):
-    self.fulltext = text
+    fulltext = text
     # Looks like text can be Relisting or Relisted. https://en.wikipedia.org/wiki/Template:Relisting
     # Hope that hasn't changed over time....
     relist_prefix = "<small>--'''''Relist"
@@ -17,7 +20,7 @@ class Nomination(BaseComment):
     # will erase any trace of it.
     if relist_ix != -1:
       text = text[:relist_ix]
-    self.relists = self.fulltext[relist_ix:].count(relist_prefix)
+    self.relists = fulltext[relist_ix:].count(relist_prefix)
     super().__init__(text)
 
     self.parse_from_tos()
@@ -27,20 +30,29 @@ class Nomination(BaseComment):
     """
     froms = []
     tos = []
-    for line in self.lines:
+    struck = []
+    for line in self.text.split('\n'):
       if RARROW in line:
-        f, t = self.parse_fromto_line(line)
+        f, t, s = self.parse_fromto_line(line)
         froms.append(f)
         tos.append(t)
+        struck.append(s)
     # nvm, make this a soft error, and handle it further up
     if len(froms) == 0:
       #raise FatalParsingException("No fromtos found in nom: {!r}".format(self.text))
-      logging.warning("No fromtos found in nom: {!r}".format(
-        self.text[:200]))
+      metrics.incr('fallback.no_fromtos')
+      diagnostics.warn('no_fromtos', "No fromtos found in nom: {!r:.200}", self.text)
     self.from_titles = froms
     self.to_titles = tos
+    # Originally proposed titles which have been struck through and replaced
+    # (or None), parallel to to_titles
+    self.struck_titles = struck
 
   def parse_fromto_line(self, line):
+    """Return (from_title, to_title, struck_title) for a line of the nom
+    having a rarrow. struck_title is None unless the proposed title has been
+    struck through and replaced.
+    """
     assert line.count(RARROW) == 1, "Too many rarrows: {!r}".format(line)
     i_arrow = line.find(RARROW)
     left = line[:i_arrow]
@@ -59,25 +71,36 @@ class Nomination(BaseComment):
     m = re.match(r'\s*<(s|del)>(.*?)</(s|del)>', right, re.IGNORECASE)
     struck_title = None
     if m:
-      logging.warning("Found stricken-through text right of rarrow. Looking past it. right={!r}".format(right))
-      struck_title = m.group(2)
+      diagnostics.warn('struck_to_title',
+          "Found stricken-through text right of rarrow. Looking past it. right={!r}", right)
+      struck_title = self.link_target(m.group(2))
       right = right[m.end():]
     # Most usual case: {{no redirect|foo}}. Also, rarely: 
     # - {{no redirect|1=foo}}
     # = {{noredirect|foo}}
     m = re.match(optional_prefix + r'{{no ?redirect\|(?:1=)?(.*?)}}', right)
     if m:
-      return frum, m.group(1)
+      return frum, m.group(1), struck_title
     # Less common: [[foo]]
     m = re.match(optional_prefix + r'\[\[:?(.*?)\]\]', right)
     if m:
-      return frum, m.group(1)
+      return frum, m.group(1), struck_title
     # Another fairly common case: ?
     # Used for 'open-ended' RMs, where nominator sees a good reason why the current
     # title is not appropriate, but doesn't want to restrict discussion to one specific
     # destination title.
     m = re.match(optional_prefix + r'\?', right)
     if m:
-      return frum, None
+      return frum, None, struck_title
     raise FatalParsingException("Couldn't find to_title in line: {!r}".format(line))
 
+  @staticmethod
+  def link_target(s):
+    """Return the title linked to by s (with {{no redirect}} or a wikilink), or
+    just s, stripped of any formatting, if it has no link.
+    """
+    m = re.search(r'{{no ?redirect\|(?:1=)?(.*?)}}|\[\[:?(.*?)\]\]', s)
+    if m:
+      return m.group(1) if m.group(1) is not None else m.group(2)
+    return s.strip(" '") or None
+
@@ -0,0 +1,41 @@
+import os
+
+class PageStates(object):
+  """Persistent record of the revision of each talk page as of when we last
+  scraped it. Stored as an append-only tsv of (title, revid, touched), in which
+  later lines take precedence.
+  """
+
+  def __init__(self, path='pages.tsv', clobber=False):
+    self.path = path
+    self.states = {}
+    if clobber and os.path.exists(path):
+      os.remove(path)
+    try:
+      f = open(path, encoding='utf-8')
+    except FileNotFoundError:
+      pass
+    else:
+      with f:
+        for line in f:
+          title, revid, touched = line.rstrip('\n').split('\t')
+          self.states[title] = (int(revid), touched)
+    self.f = open(path, 'a', encoding='utf-8')
+
+  def __contains__(self, title):
+    return title in self.states
+
+  def revid(self, title):
+    """Return the revid recorded for the given page, or None."""
+    state = self.states.get(title)
+    return state and state[0]
+
+  def record(self, title, revid, touched):
+    self.states[title] = (revid, touched)
+    self.f.write('{}\t{}\t{}\n'.format(title, revid, touched))
+
+  def flush(self):
+    self.f.flush()
+
+  def close(self):
+    self.f.close()
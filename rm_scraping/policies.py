@@ -0,0 +1,11 @@
+import re
+from collections import Counter
+
+# Citations of policies/guidelines by shortcut. e.g. WP:COMMONNAME, MOS:CAPS.
+# Shortcuts are reported as written (canonical forms are added when writing the
+# pols table; see sinks.rm_rows).
+POLICY_RE = re.compile(r'(?:MOS|WP):[A-Z]+')
+
+def policy_counts(text):
+  """Return a Counter of the policy shortcuts cited in text."""
+  return Counter(POLICY_RE.findall(text))
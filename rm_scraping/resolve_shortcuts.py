@@ -1,82 +1,137 @@
+import argparse
 import pandas as pd
 import time
 import mwclient
 import wikitextparser as wtp
+from concurrent.futures import ThreadPoolExecutor
+
+from shortcut_cache import ShortcutCache, DEFAULT_PATH, DEFAULT_TTL
+from utils import chunked
 
 debug = 0
 WRITE = (not debug) or 0
 
-def pol_to_row(pol):
-  pg = wiki.pages[pol]
-  if not pg.redirect:
+# Max number of titles per API query (for non-bot users)
+BATCH_SIZE = 50
+
+def query_all(**kwargs):
+  """Make the given query (with formatversion=2), following continuations, and
+  return a merged version of the 'query' part of the responses.
+  """
+  merged = dict(pages={}, normalized=[], redirects=[])
+  kwargs = dict(kwargs, formatversion=2)
+  cont = {}
+  while 1:
+    res = wiki.get('query', **dict(kwargs, **cont))
+    query = res.get('query', {})
+    for page in query.get('pages', []):
+      # A page's revisions may be spread over several continuations
+      merged['pages'].setdefault(page['title'], {}).update(page)
+    for key in ('normalized', 'redirects'):
+      merged[key].extend(query.get(key, []))
+    if 'continue' not in res:
+      return merged
+    cont = res['continue']
+
+def redirect_row(pol, text, dest_name):
+  """Return the row for a shortcut which is a redirect with the given wikitext
+  and target page.
+  """
+  parsed = wtp.parse(text)
+  links = parsed.wikilinks
+  if len(links) > 1:
+    print("XXX: More than 1 link in redirect page: {!r}".format(pol))
+  link = links[0]
+  expanded = link.target.replace('_', ' ')
+
+  if link.title.replace('_', ' ').replace('WP:', 'Wikipedia:') != dest_name:
+    print("Super-warning: mismatch between {!r} and {!r} for pol={}".format(
+      link.target, dest_name, pol
+      ))
+  if not expanded.startswith('Wikipedia'):
+    print("Non-WP redirect target: {}".format(expanded))
+  return dict(pol=pol, expanded=expanded)
+
+def resolve_batch(pols):
+  """Return a list of rows (dicts with keys pol, expanded) for the given
+  shortcuts (at most BATCH_SIZE), using two API queries: one to resolve
+  redirects, and one to get the wikitext of those that are redirects.
+  """
+  info = query_all(titles='|'.join(pols), redirects=1)
+  normalized = {norm['from']: norm['to'] for norm in info['normalized']}
+  redirects = {red['from']: red['to'] for red in info['redirects']}
+  # Titles of pages that don't exist (or are invalid titles)
+  missing = {title for (title, page) in info['pages'].items()
+      if page.get('missing') or page.get('invalid')}
+  redirect_texts = {}
+  redirect_titles = [normalized.get(pol, pol) for pol in pols
+      if normalized.get(pol, pol) in redirects]
+  if redirect_titles:
+    res = query_all(titles='|'.join(redirect_titles), prop='revisions',
+        rvprop='content', rvslots='main')
+    for title, page in res['pages'].items():
+      redirect_texts[title] = page['revisions'][0]['slots']['main']['content']
+
+  rows = []
+  for pol in pols:
+    title = normalized.get(pol, pol)
+    if title in redirects:
+      rows.append(redirect_row(pol, redirect_texts[title], redirects[title]))
+      continue
     # Justification: let's say expanded is the canonical title of the page
     # corresponding to the shortcut. If the shortcut is a redlink, that doesn't
     # exist (i.e. is None). If it exists but isn't a redirect, then it's the
     # "shortcut" name itself (though with the WP prefix expanded)
-    if pg.pageid is None:
+    if title in missing:
       #print("WARNING: {!r} is not a page at all".format(pol))
       expanded = None
     else:
       #print("WARNING: {!r} is not a redirect".format(pol))
-      expanded = pg.name
-  else:
-    parsed = wtp.parse(pg.text())
-    links = parsed.wikilinks
-    if len(links) > 1:
-      print("XXX: More than 1 link in redirect page: {!r}".format(pol))
-    link = links[0]
-    expanded = link.target.replace('_', ' ')
-    
-    dest = pg.redirects_to()
-    if link.title.replace('_', ' ').replace('WP:', 'Wikipedia:') != dest.name:
-      print("Super-warning: mismatch between {!r} and {!r} for pol={}".format(
-        link.target, dest.name, pol
-        ))
-    if not expanded.startswith('Wikipedia'):
-      print("Non-WP redirect target: {}".format(expanded))
-  row = dict(
-      pol=pol,
-      expanded=expanded,
-  )
-  return row
-
-
-t0 = time.time()
-w = wiki = mwclient.Site(('https', 'en.wikipedia.org'))
-
-df = pd.read_csv('pols.csv')
-pol_to_count = df.groupby('pol')['n'].sum().to_dict()
-all_pols = df.pol.unique()
-print("Loaded {} unique policy shortcuts".format(len(all_pols)))
+      expanded = title
+    rows.append(dict(pol=pol, expanded=expanded))
+  return rows
 
-rows = []
+def resolve_all(pols, n_threads=4):
+  """Return rows for all the given shortcuts, in the same order, resolving
+  up to n_threads batches concurrently.
+  """
+  with ThreadPoolExecutor(n_threads) as pool:
+    batches = pool.map(resolve_batch, chunked(pols, BATCH_SIZE))
+    return [row for batch in batches for row in batch]
 
-# Map from expanded page titles to their 'canonical' shortcuts (i.e. the one
-# most frequently used to link to it).
-exp_to_canon = {}
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-j', '--threads', type=int, default=4,
+      help='Number of batches of shortcuts to resolve concurrently')
+  parser.add_argument('--cache', default=DEFAULT_PATH,
+      help='Where to store resolved shortcuts between runs')
+  parser.add_argument('--ttl-days', type=float, default=DEFAULT_TTL/(24*60*60),
+      help='Re-resolve shortcuts last resolved longer ago than this')
+  parser.add_argument('--refresh-all', action='store_true',
+      help='Re-resolve every shortcut, regardless of when it was last resolved')
+  args = parser.parse_args()
 
-for pol in all_pols[:(5 if debug else None)]:
-  row = pol_to_row(pol)
-  row['n'] = pol_to_count[pol]
-  rows.append(row)
+  t0 = time.time()
 
-  xp = row['expanded']
-  if xp in exp_to_canon:
-    _, n = exp_to_canon[xp]
-  else:
-    n = 0
-  if row['n'] > n:
-    exp_to_canon[xp] = (pol, row['n'])
+  df = pd.read_csv('pols.csv')
+  pol_to_count = df.groupby('pol')['n'].sum().to_dict()
+  all_pols = list(df.pol.unique()[:(5 if debug else None)])
+  print("Loaded {} unique policy shortcuts".format(len(all_pols)))
 
-for row in rows:
-  if row['expanded'] is None:
-    row['canon'] = row['pol']
-  else:
-    row['canon'] = exp_to_canon[row['expanded']][0]
+  cache = ShortcutCache(args.cache, ttl=args.ttl_days*24*60*60)
+  todo = all_pols if args.refresh_all else cache.stale(all_pols)
+  print("Resolving {} new or stale shortcuts ({} cached)".format(
+    len(todo), len(all_pols)-len(todo)))
+  if todo:
+    w = wiki = mwclient.Site(('https', 'en.wikipedia.org'))
+    cache.update(resolve_all(todo, args.threads))
+  cache.set_counts({pol: pol_to_count[pol] for pol in all_pols})
+  cache.save()
 
-out = pd.DataFrame(rows)
-if WRITE:
-  out.to_csv('shortcuts.csv', index=False)
+  out = pd.DataFrame([cache.entries[pol] for pol in all_pols],
+      columns=['pol', 'expanded', 'n', 'canon'])
+  if WRITE:
+    out.to_csv('shortcuts.csv', index=False)
 
-t1 = time.time()
-print("Finished in {:.1f} seconds".format(t1-t0))
+  t1 = time.time()
+  print("Finished in {:.1f} seconds".format(t1-t0))
@@ -1,9 +1,11 @@
-import re
 import os
 import mwclient
 
 import utils
 from RM import RM
+from exceptions import SectionNotFound, OfflineError
+from sections import Section, split_sections, section_heading, anchor_keys, anchor_index
+from wikicache import WikiCache
 
 # Used for testing/debugging
 SHORTNAME_TO_SLINK = dict(
@@ -32,12 +34,36 @@ SHORTNAME_TO_SLINK = dict(
     user_talk='Talk:2015_Thalys_train_attack#Requested_move_21_November_2017',
 )
 class RMLoader(object):
+  """Loads RMs by section link or fixture shortname.
 
-  def __init__(self, rm_cls=RM, rm_kwargs=None):
-    wiki = mwclient.Site(('https', 'en.wikipedia.org'))
-    self.wiki = wiki
+  The connection to Wikipedia is only made when something actually needs to be
+  fetched. In offline mode (the default if the RM_OFFLINE environment variable
+  is set), everything is served from fixtures and the cache, and anything not
+  found there raises OfflineError.
+  """
+
+  def __init__(self, rm_cls=RM, rm_kwargs=None, cache=None, offline=None):
+    if offline is None:
+      offline = bool(os.environ.get('RM_OFFLINE'))
+    self.offline = offline
+    self._wiki = None
+    self.cache = cache or WikiCache()
     self.rm_cls = rm_cls
     self.rm_kwargs = rm_kwargs or {}
+    # (pgname, revid) -> (revid, {section_ix: text}, {anchor key: section_ix})
+    # for each page revision we've looked up sections in. In offline mode, revid
+    # is None, meaning the latest cached revision.
+    self.page_sections = {}
+    # pgname -> current revid, as of the first time we asked
+    self.revids = {}
+
+  @property
+  def wiki(self):
+    if self._wiki is None:
+      if self.offline:
+        raise OfflineError("Not connecting to Wikipedia in offline mode")
+      self._wiki = mwclient.Site(('https', 'en.wikipedia.org'))
+    return self._wiki
 
   def load(self, thing):
     if thing in SHORTNAME_TO_SLINK:
@@ -45,8 +71,16 @@ class RMLoader(object):
     return self.load_section_link(thing)
 
   def load_pg_and_section_ix(self, pgname, six):
+    if self.offline:
+      _, texts, _ = self.load_page_sections(pgname)
+      if six not in texts:
+        raise OfflineError("Section {} of {} isn't cached".format(six, pgname))
+      return self.rm_cls(texts[six], pgname, **self.rm_kwargs)
     pg = self.wiki.pages[pgname]
-    section = pg.text(section=six)
+    section = self.cache.get_section(pgname, pg.revision, six)
+    if section is None:
+      section = pg.text(section=six)
+      self.cache.put_section(pgname, pg.revision, six, section)
     return self.rm_cls(section, pgname, **self.rm_kwargs)
 
   def load_section_link(self, slink):
@@ -54,33 +88,115 @@ class RMLoader(object):
     pgname, anchor = slink.split('#')
     return self.rm_cls(txt, pgname, **self.rm_kwargs)
 
+  def load_page_sections(self, pgname):
+    """Return (revid, {section_ix: text}, {anchor key: section_ix}) for the
+    current revision of the given page. Only the page's current revid is
+    requested up front: if that revision is already in the cache, its sections
+    are served from there. Otherwise the full text is fetched with a single
+    request and split locally. The revid is memoized per page for the life of
+    the loader, and the sections per revision, so looking up any number of
+    sections on the same page costs at most two requests.
+
+    In offline mode, uses the latest revision in the cache instead.
+    """
+    revid = None if self.offline else self.current_revid(pgname)
+    key = (pgname, revid)
+    if key in self.page_sections:
+      return self.page_sections[key]
+    cached = self.cache.get_latest_sections(pgname)
+    if cached is not None and revid in (None, cached[0]):
+      result = self._cached_page_sections(pgname, *cached)
+    elif self.offline:
+      raise OfflineError("No cached revision of {}".format(pgname))
+    else:
+      result = self._fetch_page_sections(pgname)
+    self.page_sections[key] = result
+    return result
+
+  def current_revid(self, pgname):
+    if pgname not in self.revids:
+      res = self.wiki.get('query', prop='info', titles=pgname, formatversion=2)
+      page = res['query']['pages'][0]
+      if page.get('missing') or 'lastrevid' not in page:
+        raise SectionNotFound("No such page: {}".format(pgname))
+      self.revids[pgname] = page['lastrevid']
+    return self.revids[pgname]
+
+  def _fetch_page_sections(self, pgname):
+    """Fetch the full text of the current revision of the given page, cache
+    all of its sections and memoize them.
+    """
+    res = self.wiki.get('query', prop='revisions', rvprop='ids|content',
+        rvslots='main', titles=pgname, formatversion=2)
+    page = res['query']['pages'][0]
+    if page.get('missing') or 'revisions' not in page:
+      raise SectionNotFound("No such page: {}".format(pgname))
+    rev = page['revisions'][0]
+    sections = split_sections(rev['slots']['main']['content'])
+    texts = {section.index: section.text for section in sections}
+    self.cache.put_sections(pgname, rev['revid'], texts.items())
+    self.cache.put_headings(pgname, rev['revid'],
+        [(section.level, section.title) for section in sections])
+    result = rev['revid'], texts, anchor_index(sections)
+    # The page may have been edited since we asked for its revid
+    self.revids[pgname] = rev['revid']
+    self.page_sections[(pgname, rev['revid'])] = result
+    return result
+
+  def _cached_page_sections(self, pgname, revid, texts):
+    # The cache may only have some of the page's sections (e.g. just its RMs),
+    # so number duplicate headings using the page's full list of headings if
+    # we have it.
+    headings = self.cache.get_headings(pgname, revid)
+    if headings is not None:
+      sections = [Section(ix, level, title, None)
+          for ix, (level, title) in enumerate(headings, 1)]
+    else:
+      sections = [Section(ix, *section_heading(text), text)
+          for ix, text in sorted(texts.items())]
+    return revid, texts, anchor_index(sections)
+
   def load_text_from_section_link(self, slink):
-    pgname, anchor = slink.split('#')
-    stitle = utils.urldecode(anchor)
-    pg = self.wiki.pages[pgname]
-    i = 1
-    while 1:
-      section = pg.text(section=i)
-      m = re.match('==+\s*(.*?)\s*==+', section)
-      if m and m.group(1) == stitle:
-        return section
-      i += 1
-      
+    if self.offline:
+      txt = self.cache.get_ref(slink)
+      if txt is not None:
+        return txt
+    pgname, anchor = slink.split('#', 1)
+    pgname = utils.urldecode(pgname)
+    _, texts, index = self.load_page_sections(pgname)
+    ix = self._find_anchor(pgname, anchor, index)
+    if ix not in texts:
+      # Only some of the page's sections are cached (e.g. just its RMs, as
+      # cached by scrape.py)
+      if self.offline:
+        raise OfflineError("Section {} of {} ({!r}) isn't cached".format(ix, pgname, anchor))
+      _, texts, index = self._fetch_page_sections(pgname)
+      ix = self._find_anchor(pgname, anchor, index)
+    return texts[ix]
+
+  @staticmethod
+  def _find_anchor(pgname, anchor, index):
+    for key in anchor_keys(anchor):
+      if key in index:
+        return index[key]
+    raise SectionNotFound("No section matching {!r} on {}".format(anchor, pgname))
+
   def load_text_from_shortname(self, shortname):
+    # Fixtures saved before we had a WikiCache
     fname = os.path.join('fixtures', shortname+'.wiki')
     try:
       f = open(fname)
-      return f.read()
     except FileNotFoundError:
-      # Make fixtures dir if necessary
-      if not os.path.isdir('fixtures'):
-        print("Making fixtures/ directory")
-        os.mkdir('fixtures')
-      slink = SHORTNAME_TO_SLINK[shortname]
+      pass
+    else:
+      with f:
+        return f.read()
+    slink = SHORTNAME_TO_SLINK[shortname]
+    txt = self.cache.get_ref(slink)
+    if txt is None:
       txt = self.load_text_from_section_link(slink)
-      with open(fname, 'w') as f:
-        f.write(txt)
-      return txt
+      self.cache.put_ref(slink, txt)
+    return txt
 
   def load_shortname(self, shortname):
     section = self.load_text_from_shortname(shortname)
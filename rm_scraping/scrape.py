@@ -1,115 +1,438 @@
-import csv
-import os
 import mwclient
 import argparse
-import pandas as pd
+import cProfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from RM import RM
+import diagnostics
+import metrics
+from RM import RM, RMRecord
 from constants import *
+from sections import split_sections, section_heading
+from journal import Journal
+from sinks import open_sink, SINKS
+from shortcut_cache import ShortcutCache, DEFAULT_PATH as SHORTCUT_CACHE
+from wikicache import WikiCache, DEFAULT_ROOT
+from page_state import PageStates
+from utils import chunked
 
 FLUSH_EVERY = 50
 LIMIT = 0
 
 NEXT_ID = 0
+# Ids of RMs written on a previous run, for pages which are being re-scraped.
+# Maps talkpage -> rm_link -> list of ids.
+OLD_IDS = {}
+# Ids from OLD_IDS which have been reused on this run
+CLAIMED_IDS = set()
+# Number of titles per metadata query
+INFO_BATCH = 50
+# If set, a WikiCache in which to store the text of every RM section fetched.
+CACHE = None
+# If set, a Journal recording the outcome of each RM section parsed.
+JOURNAL = None
 
-def scrape_rms_for_title(title, f_fail, debug=0):
-  global NEXT_ID
-  pg = wiki.pages[title]
+def iter_sections_remote(pg):
+  """Yield (section_ix, text) pairs, one API request per section."""
   section_ix = 1
   while 1:
     try:
-      section = pg.text(section=section_ix)
+      with metrics.timer('fetch_section'):
+        section = pg.text(section=section_ix)
     except KeyError:
       break
-    if RM.section_is_rm(section):
+    yield section_ix, section
+    section_ix += 1
+
+@metrics.timed('fetch_page')
+def fetch_page_text(title):
+  """Return (revid, wikitext) for the current revision of the given page, using
+  a single API request. Returns (None, '') for missing pages.
+  """
+  res = wiki.get('query', prop='revisions', rvprop='ids|content', rvslots='main',
+      titles=title, formatversion=2)
+  page = res['query']['pages'][0]
+  if page.get('missing') or 'revisions' not in page:
+    return None, ''
+  rev = page['revisions'][0]
+  return rev['revid'], rev['slots']['main']['content']
+
+def iter_sections_local(text):
+  """Yield (section_ix, text) pairs for the sections of the given page text,
+  splitting it locally.
+  """
+  # Cheap early-out. Most pages returned by our search will have at least one
+  # RM, but no need to split pages that don't.
+  if RMTOP not in text:
+    return
+  with metrics.timer('split'):
+    sections = split_sections(text)
+  for section in sections:
+    yield section.index, section.text
+
+def fetch_rm_sections(title, per_section=False):
+  """Fetch the given talk page and return a list of (section_ix, text) pairs
+  for its RM sections. Safe to call from multiple threads.
+  """
+  if per_section:
+    pg = wiki.pages[title]
+    revid = pg.revision
+    sections = iter_sections_remote(pg)
+  else:
+    revid, text = fetch_page_text(title)
+    sections = iter_sections_local(text)
+  all_sections = list(sections)
+  sections = [(ix, sect) for (ix, sect) in all_sections if RM.section_is_rm(sect)]
+  metrics.incr('pages_fetched')
+  metrics.incr('sections_fetched', len(sections))
+  if CACHE is not None and sections:
+    CACHE.put_sections(title, revid, sections)
+    # We only cache the RM sections, so keep all the headings for resolving
+    # anchors offline (see RMLoader)
+    CACHE.put_headings(title, revid, [section_heading(sect) for (_, sect) in all_sections])
+  return sections
+
+@metrics.timed('page_info')
+def fetch_page_info(titles):
+  """Return a dict mapping each of the given titles (at most 50) to a (revid,
+  touched) pair describing its current revision, using a single API request.
+  Missing pages are omitted.
+  """
+  res = wiki.get('query', prop='info', titles='|'.join(titles), formatversion=2)
+  query = res['query']
+  renamed = {norm['to']: norm['from'] for norm in query.get('normalized', [])}
+  info = {}
+  for page in query['pages']:
+    if page.get('missing'):
+      continue
+    title = renamed.get(page['title'], page['title'])
+    info[title] = (page['lastrevid'], page['touched'])
+  return info
+
+def check_revisions(titles, states, skip, infos, recheck_unknown=False,
+    unfinished=frozenset()):
+  """Pass through the given titles, looking up their current revisions in
+  batches. Titles whose revision matches the one recorded in states (or that
+  are already in skip, and have no recorded revision) are added to skip,
+  except for those in unfinished, which still need (re)scraping regardless.
+  The current (revid, touched) of each title are added to infos.
+  """
+  for batch in chunked(titles, INFO_BATCH):
+    batch_info = fetch_page_info(batch)
+    infos.update(batch_info)
+    for title in batch:
+      revid = batch_info.get(title, (None,))[0]
+      if title in unfinished:
+        skip.discard(title)
+      elif title in states:
+        if states.revid(title) == revid:
+          skip.add(title)
+        else:
+          skip.discard(title)
+      elif recheck_unknown:
+        skip.discard(title)
+      yield title
+
+def claim_id(title, rm_link):
+  """Return the id to give an RM parsed from the given talk page: the id it
+  was written with on a previous run, if any, otherwise a new one.
+  """
+  global NEXT_ID
+  for id in OLD_IDS.get(title, {}).get(rm_link, []):
+    if id not in CLAIMED_IDS:
+      CLAIMED_IDS.add(id)
+      return id
+  id = str(NEXT_ID)
+  NEXT_ID += 1
+  return id
+
+def record_failure(f_fail, title, section_ix, e):
+  """Log a failure to parse the given section, or to fetch the whole page if
+  section_ix is None.
+  """
+  row = '{}\t{}\n'.format(title, '' if section_ix is None else section_ix)
+  f_fail.write(row)
+  # A page we failed to fetch isn't recorded as scraped, so it's fetched again
+  # on the next run without any help from the journal.
+  if JOURNAL is not None and section_ix is not None:
+    JOURNAL.failed(title, section_ix)
+  metrics.incr('failures.' + type(e).__name__)
+  print('Exception:', e)
+
+def parse_section(section, pagename, debug=0):
+  """Parse an RM section, returning an RMRecord with no id or section_ix (see
+  place_record). The RM itself, and its parse tree, are dropped on return.
+  """
+  with metrics.timer('parse'):
+    rm = RM(section, pagename, debug=debug)
+  return rm.record()
+
+def place_record(title, section_ix, record):
+  """Return the given RMRecord parsed from the given section of the given
+  page, with its id (see claim_id) and section_ix filled in.
+  """
+  id = claim_id(title, record.row['rm_link'])
+  return record._replace(id=id, row=dict(record.row, id=id), section_ix=section_ix)
+
+def parse_rm_sections(title, sections, f_fail, debug=0):
+  """Yield an RMRecord for each of the given (section_ix, text) pairs,
+  assigning ids in order. Sections that fail to parse are logged to f_fail.
+  """
+  for section_ix, section in sections:
+    try:
+      record = parse_section(section, title, debug=debug)
+    except Exception as e:
+      record_failure(f_fail, title, section_ix, e)
+    else:
+      yield place_record(title, section_ix, record)
+
+def take_worker_stats():
+  """Return (and reset) the metrics and diagnostics recorded in this worker
+  process, to be passed to merge_worker_stats in the main process.
+  """
+  return metrics.METRICS.take(), diagnostics.DIAGNOSTICS.take()
+
+def merge_worker_stats(stats):
+  metrics_delta, diagnostics_delta = stats
+  metrics.METRICS.merge(metrics_delta)
+  diagnostics.DIAGNOSTICS.merge(diagnostics_delta)
+
+def parse_section_worker(section, pagename):
+  """parse_section, plus the stats recorded in this worker process since
+  its last call.
+  """
+  return parse_section(section, pagename), take_worker_stats()
+
+def parse_pipelined(pages, n_workers, f_fail, queue_size=None):
+  """Parse the RM sections of pages (pairs as yielded by fetch_pipelined) using
+  a pool of n_workers processes. Yields (title, rms) pairs in the same order
+  as pages, where rms is a list of RMRecords, or None for skipped pages. Ids are
+  assigned here, in order, so they don't depend on the number of workers.
+  """
+  queue_size = queue_size or 2 * n_workers
+  pending = deque()
+  def finish(title, futs):
+    if futs is None:
+      return None
+    rms = []
+    for section_ix, fut in futs:
       try:
-        yield RM(section, title, debug=debug, id=NEXT_ID)
+        record, stats = fut.result()
       except Exception as e:
-        row = '{}\t{}\n'.format(title, section_ix)
-        f_fail.write(row)
-        print('Exception:', e)
+        record_failure(f_fail, title, section_ix, e)
+        continue
+      merge_worker_stats(stats)
+      rms.append(place_record(title, section_ix, record))
+    return rms
+  with ProcessPoolExecutor(n_workers) as pool:
+    for title, sections in pages:
+      if sections is None:
+        futs = None
       else:
-        NEXT_ID += 1
-    section_ix += 1
+        futs = [(ix, pool.submit(parse_section_worker, sect, title))
+            for (ix, sect) in sections]
+      pending.append((title, futs))
+      while len(pending) > queue_size:
+        title, futs = pending.popleft()
+        yield title, finish(title, futs)
+    while pending:
+      title, futs = pending.popleft()
+      yield title, finish(title, futs)
+
+def scrape_rms_for_title(title, f_fail, debug=0, per_section=False):
+  sections = fetch_rm_sections(title, per_section)
+  return parse_rm_sections(title, sections, f_fail, debug=debug)
+
+def journal_pages(pages, journal, retry_failures=False):
+  """Pass through (title, sections) pairs, dropping the sections which the
+  journal says have already been dealt with (see Journal.filter_sections).
+  """
+  for title, sections in pages:
+    if sections is not None:
+      sections = journal.filter_sections(title, sections, retry_failures)
+      if title in journal.resumed:
+        # Don't hand out the ids of RMs we're keeping
+        CLAIMED_IDS.update(journal.written_ids(title))
+    yield title, sections
+
+def fetch_pipelined(titles, n_fetchers, f_fail, per_section=False,
+    queue_size=None, skip=frozenset()):
+  """Fetch the RM sections of the given pages using a pool of n_fetchers
+  threads. Yields (title, sections) pairs in the same order as titles, with
+  at most queue_size pages fetched ahead of the consumer. Titles in skip are
+  not fetched, and are yielded with sections=None. So are pages which fail to
+  fetch, after logging the failure to f_fail.
+  """
+  def result(title, fut):
+    if fut is None:
+      return None
+    try:
+      return fut.result()
+    except Exception as e:
+      record_failure(f_fail, title, None, e)
+      return None
+
+  queue_size = queue_size or 2 * n_fetchers
+  pending = deque()
+  with ThreadPoolExecutor(n_fetchers) as pool:
+    for title in titles:
+      if title in skip:
+        fut = None
+      else:
+        fut = pool.submit(fetch_rm_sections, title, per_section)
+      pending.append((title, fut))
+      while len(pending) > queue_size or (pending and pending[0][1] is None):
+        title, fut = pending.popleft()
+        yield title, result(title, fut)
+    while pending:
+      title, fut = pending.popleft()
+      yield title, result(title, fut)
 
-def flush_rms(rms, rm_w, votes_w, pols_w):
-  rm_w.writerows(rm.row for rm in rms)
-  vote_rows = []
-  pol_rows = []
-  for rm in rms:
-    for vote in rm.votes:
-      vote['rm_id'] = rm.id
-    vote_rows.extend(rm.votes)
-    for user, counts in rm.user_to_policies.items():
-      for pol, n in counts.items():
-        row = dict(user=user, pol=pol, n=n, rm_id=rm.id)
-        pol_rows.append(row)
-  votes_w.writerows(vote_rows)
-  pols_w.writerows(pol_rows)
-    
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
-  parser.add_argument('-c', '--clobber', action='store_true', help='Overwrite existing csv files')
+  parser.add_argument('-c', '--clobber', action='store_true', help='Overwrite existing output files')
+  parser.add_argument('-o', '--output', choices=sorted(SINKS), default='csv',
+      help='Output format')
   parser.add_argument('-r', '--title-re', 
       help='Regex to add as an intitle filter to search query')
   parser.add_argument('--invert-titlematch', action='store_true', 
       help='Invert the intitle filter')
+  parser.add_argument('--per-section', action='store_true',
+      help="Fetch each section with its own API request rather than fetching "
+      "each page's full text once and splitting it locally")
+  parser.add_argument('-j', '--fetchers', type=int, default=8,
+      help='Number of pages to fetch concurrently')
+  parser.add_argument('--queue-size', type=int,
+      help='Max number of fetched pages waiting to be parsed (default: 2x fetchers)')
+  parser.add_argument('--parse-workers', type=int, default=0,
+      help='Number of processes to parse RMs in. If 0, parse in the main process')
+  parser.add_argument('--cache-dir', default=DEFAULT_ROOT,
+      help='Where to cache the wikitext of fetched RM sections')
+  parser.add_argument('--no-cache', action='store_true',
+      help="Don't cache fetched sections")
+  parser.add_argument('--replay', action='store_true',
+      help='Rebuild the csv files from the cache without going to the network. '
+      'Implies --clobber')
+  parser.add_argument('--recheck-unknown', action='store_true',
+      help='Recheck pages which have rows in rms.csv but no recorded revision '
+      '(i.e. which were scraped before we started recording revisions)')
+  parser.add_argument('--canon', nargs='?', const=SHORTCUT_CACHE, metavar='CACHE',
+      help='Add a canon column to the pols table, giving the canonical form of '
+      'each shortcut according to the cache kept by resolve_shortcuts.py '
+      '(default: {})'.format(SHORTCUT_CACHE))
+  parser.add_argument('--journal', default='journal.tsv',
+      help='Where to record the outcome of each RM section parsed, so that an '
+      'interrupted run can pick up where it left off')
+  parser.add_argument('--retry-failures', action='store_true',
+      help='Retry sections which failed to parse on a previous run (according '
+      'to the journal), rather than skipping them')
+  parser.add_argument('--metrics', default='metrics.jsonl',
+      help='File to append periodic snapshots of timers and counters to (as json lines)')
+  parser.add_argument('--metrics-every', type=float, default=30,
+      help='Seconds between metrics snapshots')
+  parser.add_argument('--warnings', choices=sorted(diagnostics.LEVELS), default='summary',
+      help='What to do with warnings about unusual RMs: nothing, summarise them '
+      'at the end, or also log them as they happen')
+  parser.add_argument('--profile', metavar='PATH',
+      help='Profile the run with cProfile, and write the stats to PATH (readable by '
+      'pstats, snakeviz, flameprof, etc.). Only covers the main process')
+  parser.add_argument('--host', default='en.wikipedia.org',
+      help='Wiki to scrape. (Mostly useful for pointing at a local stand-in server)')
+  parser.add_argument('--scheme', default='https')
+  parser.add_argument('--path', default='/w/', help='Script path of the wiki')
   args = parser.parse_args()
-  if args.clobber:
-    fresh = True
+  if args.profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+  metrics.METRICS.open_snapshots(args.metrics, args.metrics_every)
+  diagnostics.set_level(args.warnings)
+  if not args.no_cache or args.replay:
+    CACHE = WikiCache(args.cache_dir)
+  sink = open_sink(args.output, clobber=args.clobber or args.replay,
+      canon=ShortcutCache(args.canon).canon_map() if args.canon else None)
+  NEXT_ID = sink.next_id
+  OLD_IDS = sink.page_rm_ids
+  JOURNAL = Journal(args.journal, clobber=args.clobber or args.replay)
+  # Pages that were interrupted partway through need finishing (and, given
+  # --retry-failures, so do pages with failed sections) even if they haven't
+  # changed since.
+  unfinished = set(JOURNAL.partial)
+  if args.retry_failures:
+    unfinished |= JOURNAL.failed_pages
+  # Pages not to rescrape. Extended by check_revisions as we go.
+  skip = (set(sink.extant_pages) | JOURNAL.done_pages) - unfinished
+  # title -> current (revid, touched)
+  infos = {}
+  states = PageStates(clobber=args.clobber)
+  oflag = 'w' if sink.fresh else 'a'
+  f_fail = open('failures.tsv', oflag)
+
+  if args.replay:
+    pages = ((title, sections) for (title, _, sections) in CACHE.iter_pages())
   else:
-    try:
-      st = os.stat('rms.csv')
-    except FileNotFoundError:
-      fresh = True
-    else:
-      fresh = st.st_size == 0
-  extant_pages = set()
-  if not fresh:
-    df = pd.read_csv('rms.csv')
-    NEXT_ID = df['id'].max() + 1
-    print("Found existing files. Appending. Ids starting at {}".format(NEXT_ID))
-    extant_pages = set(df['talkpage'].values)
-  oflag = 'w' if fresh else 'a'
-  frm = open('rms.csv', oflag)
-  fvotes = open('votes.csv', oflag)
-  fpols = open('pols.csv', oflag)
-  out_rm = csv.DictWriter(frm, RM.COLS)
-  out_votes = csv.DictWriter(fvotes, RM.VOTE_COLS)
-  out_pols = csv.DictWriter(fpols, RM.POL_COLS)
-  writers = [out_rm, out_votes, out_pols]
-  if fresh:
-    for wr in writers:
-      wr.writeheader()
-
-  wiki = mwclient.Site(('https', 'en.wikipedia.org'))
-
-  query = 'insource:/"{}"/'.format(RMTOP)
-  if args.title_re:
-    query += ' {}intitle:/{}/'.format(
-        ('-' if args.invert_titlematch else ''),
-        args.title_re
-    )
-  results = wiki.search(query, namespace=1)
+    wiki = mwclient.Site(args.host, path=args.path, scheme=args.scheme)
+
+    query = 'insource:/"{}"/'.format(RMTOP)
+    if args.title_re:
+      query += ' {}intitle:/{}/'.format(
+          ('-' if args.invert_titlematch else ''),
+          args.title_re
+      )
+    results = metrics.METRICS.timed_iter('search', wiki.search(query, namespace=1))
+    titles = (result['title'] for result in results)
+    # Don't rescrape pages that haven't changed since we last scraped them.
+    titles = check_revisions(titles, states, skip, infos,
+        recheck_unknown=args.recheck_unknown, unfinished=unfinished)
+    pages = fetch_pipelined(titles, args.fetchers, f_fail,
+        per_section=args.per_section, queue_size=args.queue_size, skip=skip)
+  pages = journal_pages(pages, JOURNAL, retry_failures=args.retry_failures)
 
   rms = []
   failures = []
-  f_fail = open('failures.tsv', oflag)
   i_pg = 0
   i_rm = 0
   skipped = 0
-  for result in results:
-    # Don't rescrape pages we've already done.
-    if result['title'] in extant_pages:
+  if args.parse_workers:
+    parsed = parse_pipelined(pages, args.parse_workers, f_fail)
+  else:
+    parsed = (
+        (title, None if sections is None else
+          list(parse_rm_sections(title, sections, f_fail)))
+        for (title, sections) in pages
+    )
+  # Pages scraped since the last flush
+  scraped = []
+  for title, page_rms in parsed:
+    metrics.METRICS.maybe_snapshot()
+    if page_rms is None:
       skipped += 1
+      metrics.incr('pages_skipped')
+      infos.pop(title, None)
       continue
-    for rm in scrape_rms_for_title(result['title'], f_fail):
-      rms.append(rm)
-      i_rm += 1
+    if title in JOURNAL.resumed:
+      # Keep the RMs written before we were interrupted, but not any which
+      # made it into the sink without being journalled.
+      kept = JOURNAL.written_ids(title)
+      sink.replace_ids(id for link_ids in OLD_IDS.get(title, {}).values()
+          for id in link_ids if id not in kept)
+    else:
+      sink.replace_page(title)
+    rms.extend(page_rms)
+    i_rm += len(page_rms)
+    metrics.incr('rms', len(page_rms))
+    scraped.append(title)
 
     if len(rms) >= FLUSH_EVERY:
-      flush_rms(rms, out_rm, out_votes, out_pols)
+      with metrics.timer('flush'):
+        sink.write(rms)
+        sink.sync()
+      JOURNAL.written(rms, scraped)
       rms = []
+      # Only record a page as up to date once its RMs have been written
+      for pg in scraped:
+        if pg in infos:
+          states.record(pg, *infos.pop(pg))
+      scraped = []
 
     if LIMIT and i_rm >= LIMIT:
       print("Reached limit. rms={}. Stopping".format(i_rm))
@@ -120,8 +443,22 @@ if __name__ == '__main__':
       print("i_pg = {}; skipped = {}".format(i_pg, skipped))
       
   if rms:
-    flush_rms(rms, out_rm, out_votes, out_pols)
+    with metrics.timer('flush'):
+      sink.write(rms)
+      sink.sync()
+  JOURNAL.written(rms, scraped)
+  for pg in scraped:
+    if pg in infos:
+      states.record(pg, *infos.pop(pg))
 
-  for f in [frm, fvotes, fpols, f_fail]:
-      f.close()
+  states.close()
+  sink.close()
+  JOURNAL.close()
+  f_fail.close()
   print("Skipped {} pages".format(skipped))
+  metrics.METRICS.close()
+  print(metrics.METRICS.summary())
+  print(diagnostics.DIAGNOSTICS.summary())
+  if args.profile:
+    profiler.disable()
+    profiler.dump_stats(args.profile)
@@ -0,0 +1,161 @@
+import re
+from collections import namedtuple
+
+import utils
+
+# One numbered section of a page, as would be returned by pg.text(section=index)
+Section = namedtuple('Section', ['index', 'level', 'title', 'text'])
+
+# Candidate heading lines. MediaWiki allows trailing whitespace and comments
+# after the closing equals signs.
+HEADING_LINE_RE = re.compile(
+    r'^=[^\n]*=[ \t]*(?:<!--.*?-->[ \t]*)*$', re.MULTILINE,
+)
+TRAILING_JUNK_RE = re.compile(r'(?:[ \t]*<!--.*?-->)*[ \t]*$')
+
+# Stretches of text in which headings don't start new sections: comments,
+# extension tags whose contents aren't parsed as wikitext, and template calls
+# (only headings at the top level of the preprocessor tree count as sections).
+COMMENT_RE = re.compile(r'<!--.*?(?:-->|\Z)', re.DOTALL)
+NOPARSE_TAGS = ('nowiki', 'pre', 'math', 'syntaxhighlight', 'source', 'ref',
+    'gallery', 'poem', 'score', 'timeline')
+NOPARSE_RE = re.compile(
+    r'<({})\b[^>]*(?<!/)>.*?</\1\s*>'.format('|'.join(NOPARSE_TAGS)),
+    re.DOTALL | re.IGNORECASE,
+)
+BRACES_RE = re.compile(r'\{\{|\}\}')
+
+# Runs of escapes in the legacy anchor encoding, where e.g. '(' became '.28'
+LEGACY_ESCAPES_RE = re.compile(r'(?:\.[0-9A-F]{2})+')
+
+def heading_level_and_title(line):
+  """Return (level, title) for a heading line, or None if it isn't one.
+  """
+  s = TRAILING_JUNK_RE.sub('', line)
+  n = len(s)
+  lead = len(s) - len(s.lstrip('='))
+  trail = len(s) - len(s.rstrip('='))
+  if lead == n:
+    # A line consisting only of equals signs, e.g. '====='
+    level = (n - 1) // 2
+  else:
+    level = min(lead, trail)
+  if level < 1:
+    return None
+  level = min(level, 6)
+  return level, s[level:n-level].strip()
+
+def section_heading(text):
+  """Return (level, title) for the heading at the start of the text of a
+  section, or (0, '') if it doesn't start with one.
+  """
+  return heading_level_and_title(text.split('\n', 1)[0]) or (0, '')
+
+def _masked_spans(text):
+  """Return a sorted list of (start, end) spans in which headings should be
+  ignored.
+  """
+  spans = []
+  for rex in (COMMENT_RE, NOPARSE_RE):
+    spans.extend(m.span() for m in rex.finditer(text))
+  spans.sort()
+  # Template calls. Braces inside the spans above don't count.
+  depth = 0
+  start = None
+  i_span = 0
+  for m in BRACES_RE.finditer(text):
+    pos = m.start()
+    while i_span < len(spans) and spans[i_span][1] <= pos:
+      i_span += 1
+    if i_span < len(spans) and spans[i_span][0] <= pos:
+      continue
+    if m.group() == '{{':
+      if depth == 0:
+        start = pos
+      depth += 1
+    elif depth:
+      depth -= 1
+      if depth == 0:
+        spans.append((start, m.end()))
+  if depth:
+    spans.append((start, len(text)))
+  spans.sort()
+  return spans
+
+def find_headings(text):
+  """Return a list of (offset, level, title) for each heading in text that
+  MediaWiki would treat as the start of a numbered section.
+  """
+  masked = _masked_spans(text)
+  headings = []
+  i_span = 0
+  for m in HEADING_LINE_RE.finditer(text):
+    pos = m.start()
+    while i_span < len(masked) and masked[i_span][1] <= pos:
+      i_span += 1
+    if i_span < len(masked) and masked[i_span][0] <= pos:
+      continue
+    parsed = heading_level_and_title(m.group())
+    if parsed:
+      headings.append((pos,) + parsed)
+  return headings
+
+def split_sections(text):
+  """Split the full wikitext of a page into numbered sections, using the same
+  boundaries as MediaWiki's section=N parameter. Section n runs from its
+  heading up to the next heading of the same or a higher level, so it includes
+  its subsections. Section 0 (the lead) is omitted.
+  """
+  headings = find_headings(text)
+  ends = [len(text)] * len(headings)
+  open_ixs = []
+  for i, (start, level, _) in enumerate(headings):
+    while open_ixs and headings[open_ixs[-1]][1] >= level:
+      ends[open_ixs.pop()] = start
+    open_ixs.append(i)
+  sections = []
+  for i, (start, level, title) in enumerate(headings):
+    # MediaWiki rtrims the text of extracted sections
+    body = text[start:ends[i]].rstrip(' \t\n\r\0\x0b')
+    sections.append(Section(i+1, level, title, body))
+  return sections
+
+def anchor_key(s):
+  """Normalise a section title or anchor so that ones referring to the same
+  section compare equal.
+  """
+  return s.replace('_', ' ').strip()
+
+def _decode_legacy_escapes(m):
+  try:
+    return bytes.fromhex(m.group().replace('.', '')).decode('utf-8')
+  except UnicodeDecodeError:
+    return m.group()
+
+def anchor_keys(anchor):
+  """Return the keys (per anchor_key) of the section titles that the anchor of
+  a section link could be referring to, most likely first. Handles both
+  percent-encoded anchors and the older .XX encoding.
+  """
+  decoded = utils.urldecode(anchor)
+  key = anchor_key(decoded)
+  keys = [key]
+  legacy = anchor_key(LEGACY_ESCAPES_RE.sub(_decode_legacy_escapes, decoded))
+  if legacy != key:
+    keys.append(legacy)
+  return keys
+
+def anchor_index(sections):
+  """Return a dict mapping the anchor keys of the given sections to their
+  indices. As in MediaWiki, the second section with a given title gets the
+  anchor "<title>_2", and so on.
+  """
+  index = {}
+  seen = {}
+  for section in sections:
+    key = anchor_key(section.title)
+    n = seen[key] = seen.get(key, 0) + 1
+    if n > 1:
+      key = '{} {}'.format(key, n)
+    index.setdefault(key, section.index)
+  return index
@@ -0,0 +1,111 @@
+import os
+import time
+
+DEFAULT_PATH = os.path.join('.cache', 'shortcuts.tsv')
+# Resolutions older than this (in seconds) are redone by resolve_shortcuts.py
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+def add_canon(rows):
+  """Set the 'canon' key of each row (having keys pol, expanded, n) to the
+  canonical shortcut for its expanded title, i.e. the one most frequently used
+  to link to it.
+  """
+  # Map from expanded page titles to their 'canonical' shortcuts
+  exp_to_canon = {}
+  for row in rows:
+    xp = row['expanded']
+    if xp in exp_to_canon:
+      _, n = exp_to_canon[xp]
+    else:
+      n = 0
+    if row['n'] > n:
+      exp_to_canon[xp] = (row['pol'], row['n'])
+
+  for row in rows:
+    if row['expanded'] is None or row['expanded'] not in exp_to_canon:
+      row['canon'] = row['pol']
+    else:
+      row['canon'] = exp_to_canon[row['expanded']][0]
+
+class ShortcutCache(object):
+  """Persistent record of what policy shortcuts (e.g. WP:COMMONNAME) resolve to.
+
+  Each entry has the title of the page the shortcut leads to (expanded, None
+  for redlinks), the canonical shortcut for that page (canon), the number of
+  citations of the shortcut last time we counted (n), and when it was last
+  resolved (resolved_at, a unix timestamp). Stored as a tsv which is rewritten
+  in full on save.
+  """
+  COLS = ['pol', 'expanded', 'canon', 'n', 'resolved_at']
+
+  def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+    self.path = path
+    self.ttl = ttl
+    # pol -> dict with keys COLS
+    self.entries = {}
+    try:
+      f = open(path, encoding='utf-8')
+    except FileNotFoundError:
+      return
+    with f:
+      for line in f:
+        pol, expanded, canon, n, resolved_at = line.rstrip('\n').split('\t')
+        self.entries[pol] = dict(pol=pol, expanded=expanded or None, canon=canon,
+            n=int(n), resolved_at=float(resolved_at))
+
+  def __contains__(self, pol):
+    return pol in self.entries
+
+  def __len__(self):
+    return len(self.entries)
+
+  def is_stale(self, pol, now=None):
+    """Return whether the given shortcut is missing, or was resolved longer
+    than ttl seconds ago.
+    """
+    entry = self.entries.get(pol)
+    if entry is None:
+      return True
+    now = time.time() if now is None else now
+    return now - entry['resolved_at'] > self.ttl
+
+  def stale(self, pols, now=None):
+    """Return the shortcuts among pols which need (re)resolving."""
+    now = time.time() if now is None else now
+    return [pol for pol in pols if self.is_stale(pol, now)]
+
+  def update(self, rows, now=None):
+    """Record the given freshly resolved rows (dicts with keys pol, expanded).
+    Canonical forms aren't updated until the next call to set_counts.
+    """
+    now = time.time() if now is None else now
+    for row in rows:
+      entry = self.entries.setdefault(row['pol'],
+          dict(pol=row['pol'], canon=row['pol'], n=0))
+      entry['expanded'] = row['expanded']
+      entry['resolved_at'] = now
+
+  def set_counts(self, pol_to_count):
+    """Set the citation counts of the given shortcuts, and recompute the
+    canonical form of every shortcut. Shortcuts not in pol_to_count keep their
+    old counts.
+    """
+    for pol, n in pol_to_count.items():
+      if pol in self.entries:
+        self.entries[pol]['n'] = n
+    add_canon(list(self.entries.values()))
+
+  def canon_map(self):
+    """Return a dict mapping each known shortcut to its canonical form."""
+    return {pol: entry['canon'] for pol, entry in self.entries.items()}
+
+  def save(self):
+    dirname = os.path.dirname(self.path)
+    if dirname:
+      os.makedirs(dirname, exist_ok=True)
+    tmp = self.path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+      for entry in self.entries.values():
+        fields = [entry[col] for col in self.COLS]
+        f.write('\t'.join('' if val is None else str(val) for val in fields) + '\n')
+    os.replace(tmp, self.path)
@@ -0,0 +1,423 @@
+import csv
+import datetime
+import io
+import os
+import sqlite3
+
+from RM import RM
+
+def pol_cols(canon=None):
+  """Return the columns of the pols table. If we have a mapping of shortcuts to
+  their canonical forms, there's an extra canon column.
+  """
+  return RM.POL_COLS if canon is None else RM.POL_COLS + ['canon']
+
+def rm_rows(rms, canon=None):
+  """Return lists of rows (as dicts) for the rms, votes, pols and moves tables.
+  If canon (a dict mapping shortcuts to canonical shortcuts) is given, pols rows
+  have a canon column. Shortcuts not in canon are their own canonical form.
+  """
+  vote_rows = []
+  pol_rows = []
+  move_rows = []
+  for rm in rms:
+    vote_rows.extend(dict(vote, rm_id=rm.id) for vote in rm.votes)
+    for user, counts in rm.user_to_policies.items():
+      for pol, n in counts.items():
+        row = dict(user=user, pol=pol, n=n, rm_id=rm.id)
+        if canon is not None:
+          row['canon'] = canon.get(pol, pol)
+        pol_rows.append(row)
+    move_rows.extend(dict(move, rm_id=rm.id) for move in rm.moves)
+  return [rm.row for rm in rms], vote_rows, pol_rows, move_rows
+
+def flush_rms(rms, rm_w, votes_w, pols_w, moves_w, canon=None):
+  for writer, rows in zip([rm_w, votes_w, pols_w, moves_w], rm_rows(rms, canon)):
+    writer.writerows(rows)
+
+class CSVSink(object):
+  """Writes RMs to rms.csv, votes.csv, pols.csv and moves.csv, appending to
+  existing files unless clobber is True.
+
+  After construction, next_id, extant_pages and page_rm_ids describe what's
+  already been written (if anything).
+
+  If canon is given, pols.csv gets a canon column (see rm_rows).
+
+  Rows superseded by ones written on this run are dropped on close, in a
+  single rewrite of each file. Until then, their ids are logged to
+  PENDING_PATH (along with the size of each file before this run), before the
+  rows replacing them are written. If a run is interrupted, the next one
+  finishes dropping them before doing anything else.
+  """
+  PATHS = ['rms.csv', 'votes.csv', 'pols.csv', 'moves.csv']
+  ID_COLS = ['id', 'rm_id', 'rm_id', 'rm_id']
+  PENDING_PATH = 'csv_replaced.tsv'
+  # Last line of PENDING_PATH once the compacted files are all written, and
+  # just need moving into place
+  SWAP = 'swap'
+
+  def __init__(self, clobber=False, canon=None):
+    self.canon = canon
+    if clobber:
+      fresh = True
+      if os.path.exists(self.PENDING_PATH):
+        os.remove(self.PENDING_PATH)
+    else:
+      self._recover()
+      try:
+        st = os.stat('rms.csv')
+      except FileNotFoundError:
+        fresh = True
+      else:
+        fresh = st.st_size == 0
+    self.fresh = fresh
+    self.next_id = 0
+    self.extant_pages = set()
+    # talkpage -> rm_link -> list of ids
+    self.page_rm_ids = {}
+    # Pages whose pre-existing rows should be dropped on close
+    self.replaced_pages = set()
+    # Likewise for individual ids
+    self.replaced_ids = set()
+    # Ids of pre-existing rows to drop on close, all logged to PENDING_PATH
+    self.dropped_ids = set()
+    # Size of each file before we started appending to it
+    self.offsets = {path: 0 for path in self.PATHS}
+    self.f_pending = None
+    # Files which are missing or empty, and need a header
+    needs_header = set(self.PATHS) if fresh else set()
+    if not fresh:
+      for path in self.PATHS:
+        # (moves.csv, or pols.csv, may not exist, if the others were written
+        # by an older version)
+        self.offsets[path] = os.path.getsize(path) if os.path.exists(path) else 0
+        if not self.offsets[path]:
+          needs_header.add(path)
+      if 'pols.csv' not in needs_header:
+        with open('pols.csv', newline='') as f:
+          header = next(csv.reader(f), [])
+        if header != pol_cols(canon):
+          raise ValueError("Columns of existing pols.csv ({}) don't match the ones "
+              "we'd write. Use --clobber to start over.".format(', '.join(header)))
+      max_id = -1
+      with open('rms.csv', newline='') as f:
+        for row in csv.DictReader(f):
+          id = row['id']
+          max_id = max(max_id, int(id))
+          self.page_rm_ids.setdefault(row['talkpage'], {}).setdefault(
+              row['rm_link'], []).append(id)
+      self.next_id = max_id + 1
+      print("Found existing files. Appending. Ids starting at {}".format(self.next_id))
+      self.extant_pages = set(self.page_rm_ids)
+    oflag = 'w' if fresh else 'a'
+    self.files = [open(fname, oflag) for fname in self.PATHS]
+    frm, fvotes, fpols, fmoves = self.files
+    self.writers = [
+        csv.DictWriter(frm, RM.COLS),
+        csv.DictWriter(fvotes, RM.VOTE_COLS),
+        csv.DictWriter(fpols, pol_cols(canon)),
+        csv.DictWriter(fmoves, RM.MOVE_COLS),
+    ]
+    for path, wr in zip(self.PATHS, self.writers):
+      if path in needs_header:
+        wr.writeheader()
+
+  def write(self, rms):
+    self._log_replaced()
+    flush_rms(rms, *self.writers, canon=self.canon)
+
+  def replace_page(self, title):
+    """Mark the rows written for the given page on previous runs as superseded
+    by ones written on this run. They'll be removed on close.
+    """
+    if title in self.page_rm_ids:
+      self.replaced_pages.add(title)
+
+  def replace_ids(self, ids):
+    """Mark any rows written on previous runs having the given ids as
+    superseded by ones written on this run. They'll be removed as with
+    replace_page.
+    """
+    self.replaced_ids.update(ids)
+
+  def sync(self):
+    """Make sure everything written so far is on disk."""
+    for f in self.files:
+      f.flush()
+      os.fsync(f.fileno())
+
+  def _log_replaced(self):
+    """Log the ids of newly replaced rows to PENDING_PATH, and add them to
+    dropped_ids. Called before writing the rows replacing them, so if those
+    make it to disk, the next run knows to drop the old ones.
+    """
+    ids = {id for page in self.replaced_pages
+        for link_ids in self.page_rm_ids[page].values() for id in link_ids}
+    ids |= self.replaced_ids
+    ids -= self.dropped_ids
+    self.replaced_pages = set()
+    self.replaced_ids = set()
+    if not ids:
+      return
+    if self.f_pending is None:
+      self.f_pending = open(self.PENDING_PATH, 'w', encoding='utf-8')
+      self.f_pending.write('\t'.join(str(self.offsets[path]) for path in self.PATHS) + '\n')
+    self.f_pending.write(''.join(id + '\n' for id in sorted(ids)))
+    self.f_pending.flush()
+    os.fsync(self.f_pending.fileno())
+    self.dropped_ids |= ids
+
+  @classmethod
+  def _compact(cls, offsets, ids):
+    """Drop the rows having an id in ids from the first offsets[path] bytes of
+    each file (i.e. the rows written before the run which replaced them),
+    keeping everything after. Each file is rewritten to a temporary copy
+    first, and they're only moved into place once all are written, after
+    marking PENDING_PATH, so that an interrupted compaction can be finished
+    (see _recover).
+    """
+    for path, id_col in zip(cls.PATHS, cls.ID_COLS):
+      offset = offsets[path]
+      if not offset:
+        continue
+      with open(path, 'rb') as src, open(path + '.tmp', 'w', newline='') as dst:
+        old = io.StringIO(src.read(offset).decode('utf-8'), newline='')
+        reader = csv.reader(old)
+        writer = csv.writer(dst)
+        header = next(reader)
+        writer.writerow(header)
+        id_ix = header.index(id_col)
+        writer.writerows(row for row in reader if row[id_ix] not in ids)
+        dst.flush()
+        dst.buffer.write(src.read())
+        dst.flush()
+        os.fsync(dst.fileno())
+    with open(cls.PENDING_PATH, 'a', encoding='utf-8') as f:
+      f.write(cls.SWAP + '\n')
+      f.flush()
+      os.fsync(f.fileno())
+    cls._swap()
+
+  @classmethod
+  def _swap(cls):
+    for path in cls.PATHS:
+      if os.path.exists(path + '.tmp'):
+        os.replace(path + '.tmp', path)
+    os.remove(cls.PENDING_PATH)
+
+  @classmethod
+  def _recover(cls):
+    """Finish dropping the rows logged to PENDING_PATH by an interrupted run,
+    if any.
+    """
+    try:
+      f = open(cls.PENDING_PATH, encoding='utf-8')
+    except FileNotFoundError:
+      return
+    with f:
+      # A torn last line (from a crash mid-write) is ignored
+      lines = f.read().split('\n')[:-1]
+    if lines and lines[-1] == cls.SWAP:
+      cls._swap()
+      return
+    for path in cls.PATHS:
+      if os.path.exists(path + '.tmp'):
+        os.remove(path + '.tmp')
+    if not lines:
+      os.remove(cls.PENDING_PATH)
+      return
+    print("Dropping rows superseded by an interrupted run")
+    offsets = dict(zip(cls.PATHS, map(int, lines[0].split('\t'))))
+    cls._compact(offsets, set(lines[1:]))
+
+  def close(self):
+    # Pages which were rescraped, but turned out not to have any RMs
+    self._log_replaced()
+    for f in self.files:
+      f.close()
+    if self.f_pending is not None:
+      self.f_pending.close()
+      self._compact(self.offsets, self.dropped_ids)
+
+
+# Columns which should be stored as integers by the sqlite/parquet sinks
+INT_COLS = {'id', 'rm_id', 'n', 'ordinal', 'mrv', 'n_articles', 'n_relists',
+    'chars', 'n_comments', 'n_participants', 'n_votes'}
+
+def db_value(col, val):
+  """Convert a value from an RM row to one suitable for a typed table. Dates
+  are stored as strs, formatted the same way as in the csv files.
+  """
+  if val is None:
+    return None
+  if col in INT_COLS:
+    return int(val)
+  if isinstance(val, (datetime.date, datetime.datetime)):
+    return str(val)
+  return val
+
+class SQLiteRMIds(object):
+  """Lazy talkpage -> rm_link -> list of ids mapping, backed by the rms table.
+  Each page's entry is loaded (with an index lookup) on first access.
+  """
+
+  def __init__(self, db):
+    self.db = db
+    self.loaded = {}
+
+  def get(self, page, default=None):
+    if page not in self.loaded:
+      link_to_ids = {}
+      rows = self.db.execute(
+          'SELECT rm_link, id FROM rms WHERE talkpage = ? ORDER BY id', (page,))
+      for link, id in rows:
+        link_to_ids.setdefault(link, []).append(str(id))
+      self.loaded[page] = link_to_ids
+    return self.loaded[page] or default
+
+  def __contains__(self, page):
+    return self.get(page) is not None
+
+class SQLiteSink(object):
+  """Writes RMs to an sqlite database having tables rms, votes, pols and moves,
+  with the same columns as the corresponding csv files. Each call to write is a
+  single transaction, so a crash can't leave partially written batches.
+  """
+  TABLES = [
+      ('rms', RM.COLS),
+      ('votes', RM.VOTE_COLS),
+      ('pols', RM.POL_COLS),
+      ('moves', RM.MOVE_COLS),
+  ]
+  INDEXES = [
+      ('votes', 'rm_id'), ('votes', 'user'),
+      ('pols', 'rm_id'), ('pols', 'user'), ('pols', 'pol'),
+      ('rms', 'article'), ('rms', 'talkpage'),
+      # move_index.py reads the whole moves table, so its titles aren't indexed
+      ('moves', 'rm_id'),
+  ]
+
+  def __init__(self, path='rms.db', clobber=False, canon=None):
+    if clobber and os.path.exists(path):
+      os.remove(path)
+    self.canon = canon
+    self.tables = [(table, pol_cols(canon) if table == 'pols' else cols)
+        for (table, cols) in self.TABLES]
+    self.db = sqlite3.connect(path)
+    with self.db:
+      for table, cols in self.tables:
+        coldefs = ['{} INTEGER PRIMARY KEY'.format(col) if col == 'id' else col
+            for col in cols]
+        self.db.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(
+          table, ', '.join(coldefs)))
+      existing = {row[1] for row in self.db.execute('PRAGMA table_info(pols)')}
+      if canon is not None and 'canon' not in existing:
+        # Database written by a run without canonical forms. Older rows get nulls.
+        self.db.execute('ALTER TABLE pols ADD COLUMN canon')
+      for table, col in self.INDEXES:
+        self.db.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(
+          table, col))
+    max_id, = self.db.execute('SELECT max(id) FROM rms').fetchone()
+    self.fresh = max_id is None
+    self.next_id = 0 if self.fresh else max_id + 1
+    if not self.fresh:
+      print("Found existing database. Appending. Ids starting at {}".format(self.next_id))
+    self.extant_pages = {page for (page,) in
+        self.db.execute('SELECT DISTINCT talkpage FROM rms')}
+    self.page_rm_ids = SQLiteRMIds(self.db)
+    # Pages (and ids) whose existing rows should be deleted in the next transaction
+    self.replaced_pages = set()
+    self.replaced_ids = set()
+
+  def replace_page(self, title):
+    if title in self.page_rm_ids:
+      self.replaced_pages.add(title)
+
+  def replace_ids(self, ids):
+    self.replaced_ids.update(ids)
+
+  def sync(self):
+    # Every write is committed as it happens
+    pass
+
+  def _delete_ids(self, ids):
+    ids = [(int(id),) for id in ids]
+    for table, _ in self.TABLES:
+      col = 'id' if table == 'rms' else 'rm_id'
+      self.db.executemany('DELETE FROM {} WHERE {} = ?'.format(table, col), ids)
+
+  def write(self, rms):
+    with self.db:
+      for title in self.replaced_pages:
+        self._delete_ids(id for link_ids in self.page_rm_ids.get(title).values()
+            for id in link_ids)
+      self._delete_ids(self.replaced_ids)
+      self.replaced_pages = set()
+      self.replaced_ids = set()
+      for (table, cols), rows in zip(self.tables, rm_rows(rms, self.canon)):
+        self.db.executemany(
+            'INSERT INTO {} ({}) VALUES ({})'.format(
+              table, ', '.join(cols), ', '.join('?' for _ in cols)),
+            ([db_value(col, row.get(col)) for col in cols] for row in rows)
+        )
+
+  def close(self):
+    if self.replaced_pages or self.replaced_ids:
+      # Pages which were rescraped, but turned out not to have any RMs
+      self.write([])
+    self.db.close()
+
+class ParquetSink(object):
+  """Writes RMs to rms.parquet, votes.parquet, pols.parquet and moves.parquet,
+  one row group per call to write. Requires pyarrow. Parquet files can't be
+  appended to, so this always starts from scratch.
+  """
+  PATHS = ['rms.parquet', 'votes.parquet', 'pols.parquet', 'moves.parquet']
+
+  def __init__(self, clobber=False, canon=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    self.pa = pa
+    if not clobber and any(os.path.exists(path) for path in self.PATHS):
+      raise ValueError("Parquet files already exist, and can't be appended to. "
+          "Use --clobber to overwrite them.")
+    self.fresh = True
+    self.next_id = 0
+    self.extant_pages = set()
+    self.page_rm_ids = {}
+    self.canon = canon
+    self.schemas = []
+    self.writers = []
+    for path, cols in zip(self.PATHS,
+        [RM.COLS, RM.VOTE_COLS, pol_cols(canon), RM.MOVE_COLS]):
+      schema = pa.schema([
+        (col, pa.int64() if col in INT_COLS else pa.string()) for col in cols
+      ])
+      self.schemas.append(schema)
+      self.writers.append(pq.ParquetWriter(path, schema))
+
+  def replace_page(self, title):
+    pass
+
+  def replace_ids(self, ids):
+    pass
+
+  def sync(self):
+    pass
+
+  def write(self, rms):
+    for schema, writer, rows in zip(self.schemas, self.writers,
+        rm_rows(rms, self.canon)):
+      columns = {col: [db_value(col, row.get(col)) for row in rows]
+          for col in schema.names}
+      writer.write_table(self.pa.Table.from_pydict(columns, schema=schema))
+
+  def close(self):
+    for writer in self.writers:
+      writer.close()
+
+SINKS = dict(csv=CSVSink, sqlite=SQLiteSink, parquet=ParquetSink)
+
+def open_sink(kind='csv', clobber=False, canon=None):
+  return SINKS[kind](clobber=clobber, canon=canon)
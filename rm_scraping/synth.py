@@ -0,0 +1,261 @@
+"""Generate synthetic RM discussions (or whole talk pages full of them) of any
+size, for stress-testing the parser on inputs much bigger than any of the
+fixtures.
+
+The wikitext mimics the structure of real closed RMs: RM top template and
+archive message, close, (possibly relisted, possibly multi-move) nom with
+→ lines, bolded !votes (some struck through), nested replies, policy
+citations, survey/discussion subsections and move review templates.
+"""
+import argparse
+import datetime
+import random
+import re
+import sys
+
+from constants import RARROW, RMTOP
+
+ARCHIVE_MSG = (":''The following is a closed discussion of a [[WP:RM|requested move]]. "
+    "<span style=\"color:red\">'''Please do not modify it.'''</span> Subsequent "
+    "comments should be made in a new section on the talk page. Editors desiring "
+    "to contest the closing decision should consider a [[WP:MR|move review]] "
+    "after discussing it on the closer's talk page. No further edits should be "
+    "made to this discussion.''")
+RMTOP_LINE = ('<div class="boilerplate" style="background-color: #efe; margin: 0; '
+    'padding: 0 10px 0 10px; border: 1px dotted #aaa;">' + RMTOP)
+RMBOTTOM_LINE = (":''The above discussion is preserved as an archive of a "
+    "[[WP:RM|requested move]]. <span style=\"color:red\">'''Please do not modify "
+    "it.'''</span> Subsequent comments should be made in a new section on this "
+    "talk page or in a [[WP:MR|move review]]. No further edits should be made to "
+    "this section.''</div><!-- Template:RM bottom -->")
+
+POLICIES = ['WP:COMMONNAME', 'WP:CRITERIA', 'WP:PRECISION', 'WP:CONCISE',
+    'WP:NPOV', 'WP:UCRN', 'WP:RS', 'WP:NATURAL', 'WP:PRIMARYTOPIC',
+    'WP:RECOGNIZABILITY', 'WP:CONSISTENT', 'WP:OFFICIALNAME', 'MOS:CAPS',
+    'WP:NCPLACE', 'WP:DIACRITICS', 'WP:POVNAME', 'WP:TITLECHANGES']
+VOTES = ['Support', 'Oppose', 'Strong support', 'Strong oppose', 'Weak support',
+    'Weak oppose', 'Comment', 'Neutral', 'Question', 'Support alternative',
+    'Oppose both', 'Procedural close']
+OUTCOMES = ['moved', 'not moved', 'no consensus', 'page moved', 'withdrawn']
+MRV_RESULTS = ['endorsed', 'overturned', 'relisted', 'no consensus']
+WORDS = ('the of and to a in is that it for as was with be by on not this are '
+    'title name article usage sources common google books ngrams results '
+    'readers english primary topic ambiguous move proposal page current '
+    'evidence consensus policy guideline disambiguation city country region '
+    'historical official local media news scholarly per above nom clearly '
+    'however because although agree disagree prefer seems hardly').split()
+PLACES = ['Gdańsk', 'Danzig', 'Ireland', 'Republic of Ireland', 'Kiev', 'Kyiv',
+    'Burma', 'Myanmar', 'Derry', 'Londonderry', 'Macedonia', 'Côte d\'Ivoire',
+    'Cần Thơ', 'Mumbai', 'Bombay', 'Chennai', 'Madras', 'Beijing', 'Peking']
+
+class Synth(object):
+  """Generator of synthetic RM wikitext, deterministic given a seed."""
+
+  def __init__(self, seed=0, n_users=500):
+    self.rng = random.Random(seed)
+    self.users = ['Editor{}'.format(i) for i in range(n_users)]
+    # A few users do most of the talking
+    self.user_weights = [1/(i+1) for i in range(n_users)]
+    self.time = datetime.datetime(2010, 1, 1)
+
+  def user(self):
+    return self.rng.choices(self.users, self.user_weights)[0]
+
+  def tick(self, max_minutes=600):
+    self.time += datetime.timedelta(minutes=self.rng.randint(1, max_minutes))
+    return self.time
+
+  def sig(self, user=None):
+    user = user or self.user()
+    t = self.tick()
+    return '[[User:{0}|{0}]] ([[User talk:{0}|talk]]) {1:%H:%M}, {2} {1:%B %Y} (UTC)'.format(
+        user, t, t.day)
+
+  def date(self):
+    return '{} {:%B %Y}'.format(self.time.day, self.time)
+
+  def title(self):
+    rng = self.rng
+    title = rng.choice(PLACES)
+    if rng.random() < .5:
+      title = '{} ({})'.format(title, rng.choice(['city', 'region', 'band', 'film']))
+    elif rng.random() < .3:
+      title = 'History of {}'.format(title)
+    return title
+
+  def sentence(self, n_words=None):
+    rng = self.rng
+    n_words = n_words or rng.randint(5, 30)
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    for _ in range(rng.choices([0, 1, 2], [5, 3, 1])[0]):
+      words.insert(rng.randrange(len(words)+1), rng.choice(POLICIES))
+    if rng.random() < .2:
+      words.insert(rng.randrange(len(words)+1), '[[{}]]'.format(self.title()))
+    s = ' '.join(words)
+    return s[0].upper() + s[1:] + '.'
+
+  def text(self, n_sentences=None):
+    n_sentences = n_sentences or self.rng.randint(1, 4)
+    return ' '.join(self.sentence() for _ in range(n_sentences))
+
+  def vote(self):
+    """Return a top-level !vote, possibly with an earlier one struck through."""
+    rng = self.rng
+    vote = rng.choice(VOTES)
+    if rng.random() < .05:
+      vote = "<s>'''{}'''</s> '''{}'''".format(rng.choice(VOTES), vote)
+    else:
+      vote = "'''{}'''".format(vote)
+    lines = ['* {} {}'.format(vote, self.text())]
+    # Occasional multi-paragraph comment
+    while rng.random() < .1:
+      lines.append(':' + self.text())
+    lines[-1] += ' ' + self.sig()
+    return lines
+
+  def thread(self, max_depth=8):
+    """Return the lines of a !vote followed by a tree of replies to it."""
+    rng = self.rng
+    lines = self.vote()
+    depth = 1
+    while rng.random() < .6:
+      depth = max(1, min(max_depth, depth + rng.choice([-1, 0, 1, 1])))
+      prefix = '*' + ':'*depth if rng.random() < .5 else ':'*(depth+1)
+      bold = "'''{}''' ".format(rng.choice(['Comment', 'Reply', 'Note'])) if rng.random() < .05 else ''
+      lines.append('{} {}{} {}'.format(prefix, bold, self.text(), self.sig()))
+    return lines
+
+  def nom(self, n_articles=1, n_relists=0):
+    rng = self.rng
+    pairs = [(self.title(), self.title()) for _ in range(n_articles)]
+    arrows = []
+    for frum, to in pairs:
+      right = '{{{{no redirect|{}}}}}'.format(to)
+      r = rng.random()
+      if r < .05:
+        right = '?'
+      elif r < .1:
+        right = '<s>{{{{no redirect|{}}}}}</s> {}'.format(self.title(), right)
+      elif r < .15:
+        right = '[[{}]]'.format(to)
+      arrows.append('[[:{}]] {} {}'.format(frum, RARROW, right))
+    sig = self.sig()
+    for _ in range(n_relists):
+      sig += " <small>--'''''Relisting.''''' {}</small>".format(self.sig())
+    if n_articles == 1:
+      return ['{} – {} {}'.format(arrows[0], self.text(), sig)], pairs
+    lines = ['{{{{requested move/dated|multiple=yes|current1={}|new1={}}}}}'.format(*pairs[0]), '']
+    lines += ['* ' + arrow for arrow in arrows]
+    lines.append(self.text() + ' ' + sig)
+    return lines, pairs
+
+  def close(self):
+    rng = self.rng
+    outcome = rng.choice(OUTCOMES)
+    if outcome == 'moved' and rng.random() < .2:
+      result = "'''Moved''' to [[{}]]".format(self.title())
+    elif rng.random() < .05:
+      result = '{{not done}}' if 'not' in outcome else '{{done}}'
+    else:
+      result = "'''{}'''".format(outcome)
+    return 'The result of the move request was: {}. {} {}'.format(
+        result, self.text(), self.sig())
+
+  def rm(self, n_bytes=20000):
+    """Return the wikitext of a single closed RM section, of roughly n_bytes
+    (or more, for small values, since every RM has a nom and a close).
+    """
+    rng = self.rng
+    n_articles = 1 if rng.random() < .8 else rng.randint(2, 20)
+    n_relists = rng.choices([0, 1, 2, 3], [6, 3, 2, 1])[0]
+    start = self.tick()
+    nom_lines, pairs = self.nom(n_articles, n_relists)
+    disc = []
+    size = 0
+    survey = rng.random() < .5
+    if survey:
+      disc += ['', '===Survey===',
+          ":''Feel free to state your position on the renaming proposal by "
+          "beginning a new line in this section with <code>*'''Support'''</code> "
+          "or <code>*'''Oppose'''</code>, then sign your comment with "
+          "<code>~~~~</code>.''"]
+    while size < n_bytes:
+      if survey and rng.random() < .01:
+        disc += ['', '===Discussion===']
+      thread = self.thread()
+      size += sum(len(line.encode('utf-8')) + 1 for line in thread)
+      disc += thread
+    close = self.close()
+    lines = ['== Requested move {} {:%B %Y} =='.format(start.day, start)]
+    if rng.random() < .05:
+      lines.append('{{{{move review talk|date={}|result={}}}}}'.format(
+        self.date(), rng.choice(MRV_RESULTS)))
+    lines += [RMTOP_LINE, ARCHIVE_MSG, '', close, '----', '']
+    lines += nom_lines
+    lines += disc
+    lines.append(RMBOTTOM_LINE)
+    return '\n'.join(lines)
+
+  def other_section(self):
+    lines = ['== {} =='.format(self.sentence(4)[:-1])]
+    for _ in range(self.rng.randint(1, 10)):
+      lines += self.thread()
+    return '\n'.join(lines)
+
+  def page(self, n_bytes, rm_bytes=20000):
+    """Return the wikitext of a talk page of roughly n_bytes, consisting of RMs
+    (of roughly rm_bytes each) mixed in with other discussions.
+    """
+    rng = self.rng
+    sections = ['{{Talk header}}\n{{WikiProject banner shell|1=}}']
+    size = 0
+    while size < n_bytes:
+      if rng.random() < .3:
+        section = self.rm(int(rng.uniform(.1, 2) * rm_bytes))
+      else:
+        section = self.other_section()
+      size += len(section.encode('utf-8')) + 2
+      sections.append(section)
+    return '\n\n'.join(sections) + '\n'
+
+def parse_size(s):
+  """Parse a number of bytes, optionally with a K, M or G suffix."""
+  m = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)B?', s.strip().upper())
+  if not m:
+    raise ValueError("Invalid size: {!r}".format(s))
+  mult = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30}[m.group(2)]
+  return int(float(m.group(1)) * mult)
+
+def synth_rms(n, size, seed=0):
+  """Return a list of n (pagename, text) pairs of synthetic RMs of roughly the
+  given size in bytes.
+  """
+  synth = Synth(seed)
+  rms = []
+  for _ in range(n):
+    pgname = 'Talk:' + synth.title()
+    rms.append((pgname, synth.rm(size)))
+  return rms
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('size', help='Approximate size of output, e.g. 500K, 10M')
+  parser.add_argument('--page', action='store_true',
+      help='Write a whole talk page containing several RMs, rather than a single RM section')
+  parser.add_argument('--rm-size', default='20K',
+      help='With --page, the typical size of each RM')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('-o', '--output', help='Path to write to (default: stdout)')
+  args = parser.parse_args()
+
+  synth = Synth(args.seed)
+  size = parse_size(args.size)
+  if args.page:
+    text = synth.page(size, parse_size(args.rm_size))
+  else:
+    text = synth.rm(size)
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      f.write(text)
+  else:
+    sys.stdout.write(text)
@@ -0,0 +1,39 @@
+import diagnostics
+from diagnostics import Diagnostics
+
+def test_aggregate():
+  d = Diagnostics(max_samples=2)
+  with d.source('https://en.wikipedia.org/wiki/Talk:Foo'):
+    for i in range(5):
+      d.record('dummytime', 'Bad timestamp {!r:.5}', ('x'*i + 'yyyyyy',))
+  d.record('no_fromtos', 'No fromtos', ())
+  assert d.counts == {'dummytime': 5, 'no_fromtos': 1}
+  assert d.samples['dummytime'] == [
+      ('https://en.wikipedia.org/wiki/Talk:Foo', "Bad timestamp 'yyyy"),
+      ('https://en.wikipedia.org/wiki/Talk:Foo', "Bad timestamp 'xyyy"),
+  ]
+  assert d.samples['no_fromtos'] == [(None, 'No fromtos')]
+
+  main = Diagnostics(max_samples=2)
+  main.record('no_fromtos', 'No fromtos here', ())
+  main.merge(d.take())
+  assert d.counts == {}
+  assert main.counts == {'dummytime': 5, 'no_fromtos': 2}
+  assert len(main.samples['no_fromtos']) == 2
+  assert main.summary().splitlines()[1].split() == ['5', 'dummytime']
+
+class Unformattable(object):
+  def __format__(self, spec):
+    raise AssertionError("Shouldn't be formatted")
+
+def test_lazy():
+  d = Diagnostics(max_samples=0)
+  d.record('foo', '{}', (Unformattable(),))
+  assert d.counts == {'foo': 1}
+  level = diagnostics.LEVEL
+  diagnostics.LEVEL = diagnostics.OFF
+  try:
+    diagnostics.warn('foo', '{}', Unformattable())
+  finally:
+    diagnostics.LEVEL = level
+  assert 'foo' not in diagnostics.DIAGNOSTICS.counts
@@ -0,0 +1,71 @@
+from fakes import fake_record
+from journal import Journal
+
+def record(title, section_ix, id):
+  return fake_record(id, title, section_ix)
+
+def test_resume_partial_page(tmp_path):
+  path = str(tmp_path / 'journal.tsv')
+  j = Journal(path)
+  sections = [(1, 'a'), (2, 'b'), (3, 'c')]
+  assert j.filter_sections('Talk:Foo', sections) == sections
+  assert j.filter_sections('Talk:Bar', [(1, 'x')]) == [(1, 'x')]
+  j.written([record('Talk:Bar', 1, '0')], ['Talk:Bar'])
+  j.written([record('Talk:Foo', 1, '1')], [])
+  j.failed('Talk:Foo', 2)
+  j.close()
+
+  j = Journal(path)
+  assert j.partial == {'Talk:Foo'}
+  assert j.done_pages == {'Talk:Bar'}
+  assert j.failed_pages == {'Talk:Foo'}
+  assert j.written_ids('Talk:Foo') == {'1'}
+  assert j.filter_sections('Talk:Foo', sections) == [(3, 'c')]
+  assert 'Talk:Foo' in j.resumed
+  j.close()
+
+  j = Journal(path)
+  assert j.filter_sections('Talk:Foo', sections, retry_failures=True) == [(2, 'b'), (3, 'c')]
+  j.close()
+
+def test_fresh_start_after_done(tmp_path):
+  path = str(tmp_path / 'journal.tsv')
+  j = Journal(path)
+  j.filter_sections('Talk:Foo', [(1, 'a')])
+  j.written([record('Talk:Foo', 1, '0')], ['Talk:Foo'])
+  j.close()
+
+  j = Journal(path)
+  # A page that was finished gets started over if we come across it again
+  assert j.filter_sections('Talk:Foo', [(1, 'a')]) == [(1, 'a')]
+  assert j.resumed == set()
+  j.close()
+  j = Journal(path)
+  assert j.partial == {'Talk:Foo'}
+  assert j.written_ids('Talk:Foo') == set()
+
+def test_torn_line(tmp_path):
+  path = str(tmp_path / 'journal.tsv')
+  j = Journal(path)
+  j.filter_sections('Talk:Foo', [(1, 'a'), (2, 'b')])
+  j.written([record('Talk:Foo', 1, '0')], [])
+  j.close()
+  with open(path, 'a') as f:
+    f.write('Talk:Foo\t2\tok')
+
+  j = Journal(path)
+  assert j.written_ids('Talk:Foo') == {'0'}
+  j.written([record('Talk:Foo', 2, '1')], ['Talk:Foo'])
+  j.close()
+  with open(path) as f:
+    lines = f.read().splitlines()
+  assert lines[-2:] == ['Talk:Foo\t2\tok\t1', 'Talk:Foo\t\tdone\t']
+
+def test_clobber(tmp_path):
+  path = str(tmp_path / 'journal.tsv')
+  j = Journal(path)
+  j.filter_sections('Talk:Foo', [(1, 'a')])
+  j.close()
+  j = Journal(path, clobber=True)
+  assert j.partial == set()
+  j.close()
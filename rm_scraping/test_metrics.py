@@ -0,0 +1,36 @@
+import json
+
+from metrics import Metrics
+
+def test_take_and_merge():
+  m = Metrics()
+  m.incr('fallback.dummytime')
+  m.incr('rms', 3)
+  with m.timer('parse'):
+    pass
+  assert list(m.timed_iter('search', [1, 2])) == [1, 2]
+  delta = m.take()
+  assert m.snapshot()['counts'] == {}
+
+  main = Metrics()
+  main.incr('rms')
+  main.merge(delta)
+  snap = main.snapshot()
+  assert snap['counts'] == {'rms': 4, 'fallback.dummytime': 1}
+  assert snap['timers']['parse']['calls'] == 1
+  # One call per item, plus one for the final StopIteration
+  assert snap['timers']['search']['calls'] == 3
+
+def test_snapshots(tmp_path):
+  path = str(tmp_path / 'metrics.jsonl')
+  m = Metrics()
+  m.open_snapshots(path, every=3600)
+  m.incr('pages_fetched')
+  m.maybe_snapshot()
+  m.incr('pages_fetched')
+  # Too soon for another
+  m.maybe_snapshot()
+  m.close()
+  with open(path) as f:
+    snaps = [json.loads(line) for line in f]
+  assert [snap['counts']['pages_fetched'] for snap in snaps] == [1, 2]
@@ -0,0 +1,34 @@
+from fakes import fake_record
+from move_index import MoveIndex, title_key
+from sinks import CSVSink, SQLiteSink
+
+RMS = [
+  fake_record(0, 'Talk:Foo', moves=[('Foo', 'Foo (band)', None)]),
+  fake_record(1, 'Talk:Bar', moves=[('Bar', None, None), ('Foo', 'Foo (album)', 'Foo (record)')]),
+  fake_record(2, 'Talk:Baz', moves=[('Baz', 'Foo', None)]),
+]
+
+def check_index(index):
+  assert index.rms_from('Foo') == ['0', '1']
+  assert index.rms_from('foo') == ['0', '1']
+  assert index.rms_from('Bar') == ['1']
+  assert index.rms_from('Nothing') == []
+  assert index.rms_to('Foo (record)') == ['1']
+  assert index.rms_to('Foo') == ['2']
+
+def test_csv_index(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  sink = CSVSink()
+  sink.write(RMS)
+  sink.close()
+  check_index(MoveIndex.from_csv())
+
+def test_sqlite_index(tmp_path):
+  path = str(tmp_path / 'rms.db')
+  sink = SQLiteSink(path)
+  sink.write(RMS)
+  sink.close()
+  check_index(MoveIndex.from_sqlite(path))
+
+def test_title_key():
+  assert title_key('foo_bar  baz') == 'Foo bar baz'
@@ -0,0 +1,11 @@
+from policies import POLICY_RE, policy_counts
+
+TEXT = "Per WP:COMMONNAME and WP:UCRN, and WP:COMMONNAME again. Also MOS:CAPS, not WP:lower"
+
+def test_counts():
+  counts = policy_counts(TEXT)
+  assert counts == {'WP:COMMONNAME': 2, 'WP:UCRN': 1, 'MOS:CAPS': 1}
+
+def test_finditer_range():
+  hits = [(m.start(), m.group()) for m in POLICY_RE.finditer(TEXT, 10, 30)]
+  assert hits == [(22, 'WP:UCRN')]
@@ -0,0 +1,99 @@
+import pytest
+
+import scrape
+from constants import RMTOP
+from exceptions import OfflineError
+from rm_loader import RMLoader
+from wikicache import WikiCache
+
+PAGE = """Lead
+== Requested move 1 May 2019 ==
+Nom
+== Other ==
+Text
+"""
+
+class FakeWiki(object):
+  def __init__(self, revid, text):
+    self.revid = revid
+    self.text = text
+    self.requests = []
+
+  def get(self, action, prop, **kwargs):
+    self.requests.append(prop)
+    if prop == 'info':
+      page = dict(lastrevid=self.revid)
+    else:
+      page = dict(revisions=[dict(revid=self.revid, slots=dict(main=dict(content=self.text)))])
+    return dict(query=dict(pages=[page]))
+
+def loader_with(cache, wiki):
+  loader = RMLoader(cache=cache, offline=False)
+  loader._wiki = wiki
+  return loader
+
+def test_sections_served_from_cache_at_current_revid(tmp_path):
+  cache = WikiCache(str(tmp_path))
+  wiki = FakeWiki(10, PAGE)
+  revid, texts, index = loader_with(cache, wiki).load_page_sections('Talk:Foo')
+  assert wiki.requests == ['info', 'revisions']
+  assert revid == 10 and sorted(texts) == [1, 2]
+
+  # A fresh loader only needs to check the revid, once
+  wiki.requests = []
+  loader = loader_with(cache, wiki)
+  assert loader.load_page_sections('Talk:Foo') == (revid, texts, index)
+  assert loader.load_page_sections('Talk:Foo') == (revid, texts, index)
+  assert wiki.requests == ['info']
+
+  # A new revision is fetched by a loader that hasn't seen the page yet
+  wiki.revid, wiki.requests = 11, []
+  assert loader.load_page_sections('Talk:Foo')[0] == 10
+  assert loader_with(cache, wiki).load_page_sections('Talk:Foo')[0] == 11
+  assert wiki.requests == ['info', 'revisions']
+
+def test_offline_uses_latest_cached(tmp_path):
+  cache = WikiCache(str(tmp_path))
+  loader_with(cache, FakeWiki(10, PAGE)).load_page_sections('Talk:Foo')
+  loader = RMLoader(cache=cache, offline=True)
+  assert loader.load_page_sections('Talk:Foo')[0] == 10
+  with pytest.raises(OfflineError):
+    loader.load_page_sections('Talk:Bar')
+
+def test_offline_anchors_use_cached_headings(tmp_path):
+  cache = WikiCache(str(tmp_path))
+  # Only the second of two same-named sections is cached (as scrape.py caches
+  # just the RM sections), but it should still get the anchor "Requested move 2"
+  cache.put_sections('Talk:Foo', 10, [(2, '== Requested move ==\nSecond')])
+  cache.put_headings('Talk:Foo', 10, [(2, 'Requested move'), (2, 'Requested move')])
+  loader = RMLoader(cache=cache, offline=True)
+  _, texts, index = loader.load_page_sections('Talk:Foo')
+  assert index == {'Requested move': 1, 'Requested move 2': 2}
+  assert loader.load_text_from_section_link('Talk:Foo#Requested_move_2') == texts[2]
+
+RM_PAGE = """Lead
+== Requested move 1 May 2019 ==
+{}
+Nom
+== Other ==
+Text
+""".format(RMTOP)
+
+def test_anchor_to_uncached_section(tmp_path, monkeypatch):
+  # Cache the page the way scrape.py does: just its RMs, plus all its headings
+  cache = WikiCache(str(tmp_path))
+  wiki = FakeWiki(10, RM_PAGE)
+  monkeypatch.setattr(scrape, 'wiki', wiki, raising=False)
+  monkeypatch.setattr(scrape, 'CACHE', cache)
+  assert [ix for (ix, _) in scrape.fetch_rm_sections('Talk:Foo')] == [1]
+
+  loader = RMLoader(cache=cache, offline=True)
+  assert loader.load_text_from_section_link('Talk:Foo#Requested_move_1_May_2019').endswith('Nom')
+  with pytest.raises(OfflineError):
+    loader.load_text_from_section_link('Talk:Foo#Other')
+
+  # Online, the page is fetched in full
+  wiki.requests = []
+  loader = loader_with(cache, wiki)
+  assert loader.load_text_from_section_link('Talk:Foo#Other') == '== Other ==\nText'
+  assert wiki.requests == ['info', 'revisions']
@@ -2,7 +2,11 @@ from collections import Counter
 import pytest_check as check
 
 from RM import RM
+from base_comment import BaseComment
+from nomination import Nomination
 from rm_loader import RMLoader
+from comment_extractor import CLOSE, NOM, DISCUSSION
+from synth import synth_rms
 
 
 class RMTest(RM):
@@ -217,3 +221,75 @@ def test_user_underscore_talk():
       from_title='2015 Thalys train attack',
       to_title='Thalys train attack',
   )
+
+def test_author():
+  comment = BaseComment("'''Support''' per [[User:Foo|Foo]]. [[File:X.png|20px|[[User:Baz]]]] "
+    "[[User:Bar|Bar]] ([[User talk:Bar#top|talk]]) 12:00, 1 March 2019 (UTC)")
+  assert comment.author == 'Bar'
+  ip_comment = BaseComment("Oppose. [[Special:Contributions/1.2.3.4|1.2.3.4]] "
+    "([[User talk:1.2.3.4|talk]]) 12:00, 1 March 2019 (UTC)")
+  assert ip_comment.author == '1.2.3.4'
+
+def test_stage_cols_cover_cols():
+  stage_cols = (RM.IDENTITY_COLS + RM.MRV_COLS + RM.CLOSE_COLS + RM.NOM_COLS
+      + RM.DISCUSSION_COLS)
+  assert sorted(stage_cols) == sorted(RM.COLS)
+
+def test_projected_cols():
+  full = load_rm('talkative_closer')
+  for cols in [RM.CLOSE_COLS, RM.NOM_COLS, RM.MRV_COLS + ['outcome']]:
+    projected = RMLoader(rm_kwargs=dict(cols=cols, votes=False, pols=False)
+        ).load_shortname('talkative_closer')
+    assert projected.row == {col: full.row[col] for col in RM.IDENTITY_COLS + cols}
+    assert projected.votes == []
+    assert not projected.user_to_policies
+  close_only = RMLoader(rm_kwargs=dict(cols=RM.CLOSE_COLS, votes=False, pols=False)
+      ).load_shortname('talkative_closer')
+  assert not hasattr(close_only.extracted, 'nom')
+  assert close_only.extracted.comment_spans == []
+
+def test_plan():
+  assert RM.plan() == (True, DISCUSSION)
+  assert RM.plan(RM.CLOSE_COLS, votes=False, pols=False) == (False, CLOSE)
+  assert RM.plan(RM.NOM_COLS, votes=False, pols=False) == (False, NOM)
+  assert RM.plan(RM.CLOSE_COLS, votes=False, pols=False, moves=True) == (False, NOM)
+  assert RM.plan(RM.MRV_COLS, votes=False, pols=False) == (True, 0)
+  assert RM.plan(RM.CLOSE_COLS) == (False, DISCUSSION)
+
+def test_projected_synth():
+  for pgname, text in synth_rms(5, 5000):
+    full = RM(text, pgname)
+    assert full.moves
+    close_only = RM(text, pgname, cols=RM.CLOSE_COLS, votes=False, pols=False)
+    assert close_only.upto == CLOSE
+    assert close_only.row == {col: full.row[col] for col in RM.IDENTITY_COLS + RM.CLOSE_COLS}
+    assert not hasattr(close_only.extracted, 'nom')
+    assert close_only.moves == []
+    assert 'Requested Move' in str(close_only)
+    nom_only = RM(text, pgname, cols=RM.NOM_COLS, votes=False, pols=False)
+    assert nom_only.upto == NOM
+    assert nom_only.row == {col: full.row[col] for col in RM.IDENTITY_COLS + RM.NOM_COLS}
+    assert nom_only.moves == full.moves
+    assert nom_only.votes == []
+
+def test_merge_votes():
+  [(pgname, text)] = synth_rms(1, 3000)
+  rm = RM(text, pgname)
+  rm.votes = [dict(user=user, vote=vote) for (user, vote) in [
+    ('A', 'Keep'), ('A', 'Speedy close'),
+    ('B', 'Question about the move'), ('B', 'Oppose'),
+    ('C', ''), ('C', 'Comment'), ('C', 'Removed'),
+  ]]
+  rm._merge_votes()
+  # The keyword rule picks these, whatever classify would make of them
+  assert sorted((v['user'], v['vote']) for v in rm.votes) == [
+      ('A', 'Speedy close'), ('B', 'Question about the move'), ('C', 'Removed')]
+
+def test_struck_to_title():
+  nom = Nomination(
+    "[[:Foo]] → <s>{{no redirect|Foo (band)}}</s> {{no redirect|Foo (group)}}\n"
+    "[[:Foo 2]] → ?\n"
+    "Per WP:COMMONNAME. [[User:Bar|Bar]] ([[User talk:Bar|talk]]) 12:00, 1 March 2019 (UTC)")
+  assert nom.from_titles == ['Foo', 'Foo 2']
+  assert nom.to_titles == ['Foo (group)', None]
+  assert nom.struck_titles == ['Foo (band)', None]
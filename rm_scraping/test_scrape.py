@@ -0,0 +1,176 @@
+import io
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mwclient
+import pytest
+
+import scrape
+from constants import *
+from journal import Journal
+
+# Seconds of simulated network latency per API request
+LATENCY = .05
+
+def fake_talkpage(i):
+  return '\n'.join([
+    'Lead',
+    '== Requested move {} =='.format(i),
+    '<div class="boilerplate">' + RMTOP,
+    ":''The following is a closed discussion of a [[WP:RM|requested move]].''",
+    "The result of the move request was: '''not moved'''. [[User:Closer|Closer]] 01:00, 2 March 2019 (UTC)",
+    '----',
+    '[[Page {}]] → {{{{no redirect|Other page {}}}}} – Because. [[User:Nom|Nom]] 01:00, 1 March 2019 (UTC)'.format(i, i),
+    '== Unrelated ==',
+    'Chatter',
+  ])
+
+PAGES = {'Talk:Page {}'.format(i): fake_talkpage(i) for i in range(40)}
+
+class StandInAPIHandler(BaseHTTPRequestHandler):
+  """Answers just enough of the MediaWiki action API for scrape.fetch_page_text
+  and scrape.fetch_page_info
+  """
+  def do_GET(self):
+    params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+    title = params['titles'][0]
+    time.sleep(LATENCY)
+    if params['prop'][0] == 'info':
+      pages = [
+          dict(title=t, lastrevid=1, touched='2019-03-02T01:00:00Z')
+          if t in PAGES else dict(title=t, missing=True)
+          for t in title.split('|')
+      ]
+      self.respond(dict(query=dict(pages=pages)))
+      return
+    if title in PAGES:
+      page = dict(title=title, revisions=[dict(
+        revid=1, slots=dict(main=dict(content=PAGES[title])),
+      )])
+    else:
+      page = dict(title=title, missing=True)
+    self.respond(dict(query=dict(pages=[page])))
+
+  def respond(self, res):
+    body = json.dumps(res).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+@pytest.fixture(scope='module')
+def standin_wiki():
+  server = ThreadingHTTPServer(('localhost', 0), StandInAPIHandler)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  host = 'localhost:{}'.format(server.server_address[1])
+  scrape.wiki = mwclient.Site(host, path='/', scheme='http', do_init=False)
+  yield scrape.wiki
+  server.shutdown()
+
+def timed_fetch(titles, n_fetchers):
+  t0 = time.time()
+  res = list(scrape.fetch_pipelined(titles, n_fetchers, f_fail=None, skip={titles[1]}))
+  return res, time.time() - t0
+
+def test_fetch_pipelined(standin_wiki):
+  titles = sorted(PAGES) + ['Talk:Missing']
+  serial, t_serial = timed_fetch(titles, 1)
+  pipelined, t_pipelined = timed_fetch(titles, 8)
+  # Same results in the same order, regardless of the number of fetchers
+  assert pipelined == serial
+  assert [title for (title, _) in pipelined] == titles
+  assert pipelined[1][1] is None
+  assert pipelined[-1][1] == []
+  title, sections = pipelined[0]
+  assert [ix for (ix, _) in sections] == [1]
+  assert t_pipelined * 4 < t_serial
+
+def test_ids_deterministic(standin_wiki):
+  scrape.NEXT_ID = 0
+  rms = []
+  for title, sections in scrape.fetch_pipelined(sorted(PAGES), 8, f_fail=None):
+    rms.extend(scrape.parse_rm_sections(title, sections, f_fail=None))
+  assert [rm.id for rm in rms] == [str(i) for i in range(len(PAGES))]
+  assert [rm.row['talkpage'] for rm in rms] == sorted(PAGES)
+
+def test_parse_pipelined(standin_wiki):
+  scrape.NEXT_ID = 0
+  pages = list(scrape.fetch_pipelined(sorted(PAGES), 8, f_fail=None))
+  serial = [rm for (title, sections) in pages
+      for rm in scrape.parse_rm_sections(title, sections, f_fail=None)]
+  scrape.NEXT_ID = 0
+  parallel = [rm for (_, rms) in scrape.parse_pipelined(pages, 4, f_fail=None)
+      for rm in rms]
+  assert [rm.id for rm in parallel] == [rm.id for rm in serial]
+  assert [rm.row for rm in parallel] == [rm.row for rm in serial]
+  assert [rm.votes for rm in parallel] == [rm.votes for rm in serial]
+
+def test_fetch_failure_continues(standin_wiki, monkeypatch):
+  fetch = scrape.fetch_rm_sections
+  def flaky_fetch(title, per_section=False):
+    if title == 'Talk:Page 1':
+      raise ConnectionError('Connection reset')
+    return fetch(title, per_section)
+  monkeypatch.setattr(scrape, 'fetch_rm_sections', flaky_fetch)
+  f_fail = io.StringIO()
+  pages = list(scrape.fetch_pipelined(sorted(PAGES)[:3], 2, f_fail))
+  assert [title for (title, _) in pages] == sorted(PAGES)[:3]
+  assert pages[1] == ('Talk:Page 1', None)
+  assert pages[2][1]
+  assert f_fail.getvalue() == 'Talk:Page 1\t\n'
+
+class FakeStates(dict):
+  def revid(self, title):
+    return self[title]
+
+def test_check_revisions(standin_wiki):
+  titles = ['Talk:Page 0', 'Talk:Page 1', 'Talk:Page 2', 'Talk:Missing']
+  states = FakeStates({'Talk:Page 0': 1, 'Talk:Page 1': 0})
+  # Page 2 was scraped before we kept track of revisions
+  skip = {'Talk:Page 1', 'Talk:Page 2'}
+  infos = {}
+  assert list(scrape.check_revisions(titles, states, skip, infos)) == titles
+  assert skip == {'Talk:Page 0', 'Talk:Page 2'}
+  assert infos['Talk:Page 1'] == (1, '2019-03-02T01:00:00Z')
+  assert 'Talk:Missing' not in infos
+
+def test_retry_failures_refetches_unchanged_page(standin_wiki, tmp_path):
+  title = 'Talk:Page 0'
+  path = str(tmp_path / 'journal.tsv')
+  journal = Journal(path)
+  journal.filter_sections(title, [(1, 'text')])
+  journal.failed(title, 1)
+  journal.written([], [title])
+  journal.close()
+  # The page's revision was recorded when it was flushed, and hasn't changed
+  states = FakeStates({title: 1})
+
+  def fetched(retry_failures):
+    journal = Journal(path)
+    unfinished = journal.partial | (journal.failed_pages if retry_failures else set())
+    skip = {title} - unfinished
+    titles = scrape.check_revisions([title], states, skip, {}, unfinished=unfinished)
+    pages = scrape.fetch_pipelined(titles, 1, f_fail=None, skip=skip)
+    res = list(scrape.journal_pages(pages, journal, retry_failures=retry_failures))
+    journal.close()
+    return res
+
+  assert fetched(False) == [(title, None)]
+  [(_, sections)] = fetched(True)
+  assert [ix for (ix, _) in sections] == [1]
+
+def test_claim_id():
+  scrape.NEXT_ID = 10
+  scrape.OLD_IDS = {'Talk:Foo': {'Talk:Foo#RM': ['3']}}
+  assert scrape.claim_id('Talk:Foo', 'Talk:Foo#RM') == '3'
+  assert scrape.claim_id('Talk:Foo', 'Talk:Foo#RM') == '10'
+  assert scrape.claim_id('Talk:Bar', 'Talk:Bar#RM') == '11'
+  scrape.OLD_IDS = {}
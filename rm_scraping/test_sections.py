@@ -0,0 +1,53 @@
+from sections import split_sections, heading_level_and_title, anchor_keys, anchor_index
+
+PAGE = """Lead text
+== First ==
+Para
+=== Sub ===
+Subpara
+== Second == <!-- trailing comment -->
+<!--
+== Commented out ==
+-->
+<nowiki>
+== Not a heading ==
+</nowiki>
+{{Some template|
+== Inside template ==
+}}
+Text
+
+== Third ==
+End
+
+"""
+
+def test_heading_levels():
+  assert heading_level_and_title('== Foo ==') == (2, 'Foo')
+  assert heading_level_and_title('===Foo==') == (2, '=Foo')
+  assert heading_level_and_title('== Foo == <!-- x -->') == (2, 'Foo')
+  assert heading_level_and_title('=') is None
+
+def test_split_sections():
+  sections = split_sections(PAGE)
+  assert [s.index for s in sections] == [1, 2, 3, 4]
+  assert [s.title for s in sections] == ['First', 'Sub', 'Second', 'Third']
+  assert [s.level for s in sections] == [2, 3, 2, 2]
+  # Level 2 sections include their subsections
+  assert sections[0].text == '== First ==\nPara\n=== Sub ===\nSubpara'
+  assert sections[1].text == '=== Sub ===\nSubpara'
+  assert sections[2].text.endswith('}}\nText')
+  assert sections[3].text == '== Third ==\nEnd'
+
+def test_anchors():
+  sections = split_sections(
+      "== Requested move ==\na\n== Foo (bar) ==\nb\n== Requested move ==\nc\n")
+  index = anchor_index(sections)
+  assert index == {'Requested move': 1, 'Foo (bar)': 2, 'Requested move 2': 3}
+  assert anchor_keys('Requested_move_2') == ['Requested move 2']
+  assert anchor_keys('Foo_%28bar%29') == ['Foo (bar)']
+  # Legacy encoding
+  keys = anchor_keys('Foo_.28bar.29')
+  assert keys == ['Foo .28bar.29', 'Foo (bar)']
+  assert [index.get(key) for key in keys] == [None, 2]
+  assert anchor_keys('Caf.C3.A9') == ['Caf.C3.A9', 'Café']
@@ -0,0 +1,21 @@
+from shortcut_cache import ShortcutCache
+
+def test_staleness_and_canon(tmp_path):
+  path = str(tmp_path / 'shortcuts.tsv')
+  cache = ShortcutCache(path, ttl=100)
+  assert cache.stale(['WP:CN', 'WP:COMMONNAME']) == ['WP:CN', 'WP:COMMONNAME']
+  cache.update([
+    dict(pol='WP:CN', expanded='Wikipedia:Article titles#Common names'),
+    dict(pol='WP:COMMONNAME', expanded='Wikipedia:Article titles#Common names'),
+    dict(pol='WP:NOTAPAGE', expanded=None),
+  ], now=1000)
+  cache.set_counts({'WP:CN': 2, 'WP:COMMONNAME': 10, 'WP:NOTAPAGE': 1})
+  cache.save()
+
+  cache = ShortcutCache(path, ttl=100)
+  assert len(cache) == 3
+  assert cache.canon_map() == {'WP:CN': 'WP:COMMONNAME',
+      'WP:COMMONNAME': 'WP:COMMONNAME', 'WP:NOTAPAGE': 'WP:NOTAPAGE'}
+  assert cache.entries['WP:NOTAPAGE']['expanded'] is None
+  assert cache.stale(['WP:CN', 'WP:NEW'], now=1050) == ['WP:NEW']
+  assert cache.stale(['WP:CN', 'WP:NEW'], now=1200) == ['WP:CN', 'WP:NEW']
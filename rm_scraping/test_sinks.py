@@ -0,0 +1,138 @@
+import datetime
+import os
+from collections import Counter
+
+from fakes import fake_record
+from sinks import SQLiteSink, CSVSink, rm_rows
+
+def fake_rm(id, talkpage, voter='Alice'):
+  article = talkpage[len('Talk:'):]
+  return fake_record(id, talkpage,
+      votes=[dict(user=voter, vote='Support', date=datetime.date(2019, 3, 2))],
+      pols={voter: Counter({'WP:COMMONNAME': 2})},
+      moves=[(article, article + ' (band)', None)],
+      nom_date=datetime.datetime(2019, 3, 1, 12, 30), n_votes=1)
+
+def test_sqlite_resume_and_replace(tmp_path):
+  path = str(tmp_path / 'rms.db')
+  sink = SQLiteSink(path)
+  assert sink.fresh
+  sink.write([fake_rm(0, 'Talk:Foo'), fake_rm(1, 'Talk:Bar')])
+  sink.close()
+
+  sink = SQLiteSink(path)
+  assert not sink.fresh
+  assert sink.next_id == 2
+  assert sink.extant_pages == {'Talk:Foo', 'Talk:Bar'}
+  assert sink.page_rm_ids.get('Talk:Foo') == {'Talk:Foo#RM': ['0']}
+  assert 'Talk:Baz' not in sink.page_rm_ids
+  # Rescrape Talk:Foo, reusing its id
+  sink.replace_page('Talk:Foo')
+  sink.write([fake_rm(0, 'Talk:Foo', voter='Bob')])
+  sink.close()
+
+  sink = SQLiteSink(path)
+  votes = sink.db.execute('SELECT user, vote, date, rm_id FROM votes ORDER BY rm_id').fetchall()
+  assert votes == [('Bob', 'Support', '2019-03-02', 0), ('Alice', 'Support', '2019-03-02', 1)]
+  pols = sink.db.execute('SELECT user, pol, n, rm_id FROM pols ORDER BY rm_id').fetchall()
+  assert pols == [('Bob', 'WP:COMMONNAME', 2, 0), ('Alice', 'WP:COMMONNAME', 2, 1)]
+  moves = sink.db.execute('SELECT rm_id, ordinal, from_title FROM moves ORDER BY rm_id').fetchall()
+  assert moves == [(0, 0, 'Foo'), (1, 0, 'Bar')]
+  nom_date, = sink.db.execute('SELECT nom_date FROM rms WHERE id = 0').fetchone()
+  assert nom_date == '2019-03-01 12:30:00'
+  sink.close()
+
+def test_sqlite_canon(tmp_path):
+  path = str(tmp_path / 'rms.db')
+  # A database written without canonical forms gets a canon column added
+  sink = SQLiteSink(path)
+  sink.write([fake_rm(0, 'Talk:Foo')])
+  sink.close()
+  sink = SQLiteSink(path, canon={'WP:COMMONNAME': 'WP:CN'})
+  sink.write([fake_rm(1, 'Talk:Bar')])
+  sink.close()
+
+  sink = SQLiteSink(path)
+  pols = sink.db.execute('SELECT pol, canon, rm_id FROM pols ORDER BY rm_id').fetchall()
+  assert pols == [('WP:COMMONNAME', None, 0), ('WP:COMMONNAME', 'WP:CN', 1)]
+  sink.close()
+
+def test_csv_replace_ids(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  sink = CSVSink()
+  sink.write([fake_rm(0, 'Talk:Foo'), fake_rm(1, 'Talk:Foo'), fake_rm(2, 'Talk:Bar')])
+  sink.sync()
+  sink.close()
+
+  sink = CSVSink()
+  assert sink.next_id == 3
+  assert sink.extant_pages == {'Talk:Foo', 'Talk:Bar'}
+  assert sink.page_rm_ids['Talk:Foo'] == {'Talk:Foo#RM': ['0', '1']}
+  # Resuming Talk:Foo, keeping RM 0 and rewriting RM 1
+  sink.replace_ids(['1'])
+  sink.write([fake_rm(1, 'Talk:Foo', voter='Bob')])
+  sink.sync()
+
+  def votes():
+    with open('votes.csv') as f:
+      next(f)
+      return sorted(line.split(',')[0] + line.split(',')[-1].strip() for line in f)
+  # The superseded rows are only dropped on close, in one pass
+  assert votes() == ['Alice0', 'Alice1', 'Alice2', 'Bob1']
+  sink.write([fake_rm(3, 'Talk:Baz')])
+  sink.close()
+  assert votes() == ['Alice0', 'Alice2', 'Alice3', 'Bob1']
+  assert not os.path.exists(CSVSink.PENDING_PATH)
+
+def test_csv_replace_interrupted(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  sink = CSVSink()
+  sink.write([fake_rm(0, 'Talk:Foo'), fake_rm(1, 'Talk:Bar')])
+  sink.close()
+
+  sink = CSVSink()
+  sink.replace_page('Talk:Foo')
+  sink.write([fake_rm(0, 'Talk:Foo', voter='Bob')])
+  sink.sync()
+  # Killed before closing. The next run drops the superseded rows first.
+  sink = CSVSink()
+  assert sink.page_rm_ids['Talk:Foo'] == {'Talk:Foo#RM': ['0']}
+  sink.close()
+  with open('votes.csv') as f:
+    assert [line.split(',')[0] for line in f] == ['user', 'Alice', 'Bob']
+  with open('rms.csv') as f:
+    assert len(f.readlines()) == 3
+
+def test_csv_missing_pols(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  sink = CSVSink()
+  sink.write([fake_rm(0, 'Talk:Foo')])
+  sink.close()
+  os.remove('pols.csv')
+  sink = CSVSink()
+  sink.write([fake_rm(1, 'Talk:Bar')])
+  sink.close()
+  with open('pols.csv') as f:
+    assert f.readline().strip() == 'user,pol,n,rm_id'
+
+def test_rm_rows_leave_records_alone():
+  record = fake_rm(0, 'Talk:Foo')
+  rows, votes, pols, moves = rm_rows([record])
+  assert votes[0]['rm_id'] == moves[0]['rm_id'] == '0'
+  assert 'rm_id' not in record.votes[0]
+  assert 'rm_id' not in record.moves[0]
+
+def test_csv_interrupted_swap(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  sink = CSVSink()
+  sink.write([fake_rm(0, 'Talk:Foo')])
+  sink.close()
+  # Killed after writing the compacted votes.csv, but before moving it into place
+  with open('votes.csv.tmp', 'w') as f:
+    f.write('user,vote,date,rm_id\n')
+  with open(CSVSink.PENDING_PATH, 'w') as f:
+    f.write('0\t0\t0\t0\n0\n' + CSVSink.SWAP + '\n')
+  CSVSink().close()
+  with open('votes.csv') as f:
+    assert f.read() == 'user,vote,date,rm_id\n'
+  assert not os.path.exists('votes.csv.tmp')
@@ -0,0 +1,25 @@
+import datetime
+
+import dateparser
+
+import metrics
+from timestamps import parse_sig_time, parse_date
+
+def test_sig_time():
+  for timestr in ['04:35, 16 December 2018', '23:01 on 1 Feb 2012', '00:00, 29 February 2016']:
+    assert parse_sig_time(timestr) == dateparser.parse(timestr)
+  assert parse_sig_time('04:35, 16 December 2018') == datetime.datetime(2018, 12, 16, 4, 35)
+
+def test_date():
+  exp = datetime.date(2019, 3, 5)
+  for datestr in ['5 March 2019', 'March 5, 2019', '2019 March 5', '2019-03-05', ' 5 Mar 2019\n']:
+    assert parse_date(datestr) == exp
+
+def test_fallbacks_counted_per_call():
+  metrics.METRICS.take()
+  for _ in range(3):
+    parse_sig_time('04:35, 16 Decembruary 2018')
+    parse_date('the fifth of March')
+  parse_sig_time('04:35, 16 December 2018')
+  counts, _, _ = metrics.METRICS.take()
+  assert counts['fallback.dateparser'] == 6
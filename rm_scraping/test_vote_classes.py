@@ -0,0 +1,42 @@
+import pytest
+
+from vote_classes import (classify, classify_votes, vote_power,
+    NONE, SUPPORT, OPPOSE, NEUTRAL, COMMENT, ALT, OTHER, PLAIN, STRONG, WEAK)
+
+VOTES = {
+  'Support': (SUPPORT, PLAIN),
+  'Strong support': (SUPPORT, STRONG),
+  'Support per nom': (SUPPORT, PLAIN),
+  "'''Weak oppose'''": (OPPOSE, WEAK),
+  'Strongly Oppose': (OPPOSE, STRONG),
+  'Oppose, support alternative': (OPPOSE, PLAIN),
+  "Don't move": (OPPOSE, PLAIN),
+  'Keep': (OPPOSE, PLAIN),
+  '<s>Support</s> Oppose': (OPPOSE, PLAIN),
+  'Move': (SUPPORT, PLAIN),
+  'No objection': (SUPPORT, PLAIN),
+  'Neutral': (NEUTRAL, PLAIN),
+  'Comment': (COMMENT, PLAIN),
+  'Alternative proposal': (ALT, PLAIN),
+  'Weak alt': (ALT, WEAK),
+  'Speedy close': (OTHER, STRONG),
+  'Removed': (OTHER, PLAIN),
+  '': (NONE, PLAIN),
+}
+
+def test_classify():
+  for vote, codes in VOTES.items():
+    assert classify(vote) == codes, vote
+
+def test_classify_votes():
+  pd = pytest.importorskip('pandas')
+  votes = pd.Series(list(VOTES) * 3 + [None], index=range(10, 10 + 3*len(VOTES) + 1))
+  classes = classify_votes(votes)
+  assert list(classes.index) == list(votes.index)
+  expected = [VOTES[vote] for vote in list(VOTES) * 3] + [(NONE, PLAIN)]
+  assert list(zip(classes['category'], classes['strength'])) == expected
+
+def test_vote_power():
+  assert vote_power('') == 0
+  assert vote_power('Comment') == 1
+  assert vote_power('Strong Oppose') == 2
@@ -0,0 +1,43 @@
+from wikicache import WikiCache
+
+def test_sections(tmp_path):
+  cache = WikiCache(str(tmp_path))
+  cache.put_sections('Talk:Foo', 10, [(1, 'one'), (3, 'three')])
+  cache.put_sections('Talk:Bar', 5, [(2, 'bar')])
+  # A newer revision replaces the old one for replay purposes
+  cache.put_sections('Talk:Foo', 12, [(1, 'one'), (4, 'four')])
+  pages = list(cache.iter_pages())
+  assert pages == [
+      ('Talk:Foo', 12, [(1, 'one'), (4, 'four')]),
+      ('Talk:Bar', 5, [(2, 'bar')]),
+  ]
+  assert cache.get_section('Talk:Foo', 10, 3) == 'three'
+  assert cache.get_section('Talk:Foo', 12, 3) is None
+  assert cache.get_latest_sections('Talk:Foo') == (12, {1: 'one', 4: 'four'})
+  assert cache.get_latest_sections('Talk:Baz') is None
+  # Identical texts are stored once
+  assert len(list((tmp_path / 'objects').glob('*/*'))) == 4
+
+def test_refs(tmp_path):
+  cache = WikiCache(str(tmp_path))
+  assert cache.get_ref('Talk:Foo#Bar') is None
+  cache.put_ref('Talk:Foo#Bar', 'text')
+  assert WikiCache(str(tmp_path)).get_ref('Talk:Foo#Bar') == 'text'
+
+def test_index_loaded_once(tmp_path):
+  cache = WikiCache(str(tmp_path))
+  cache.put_sections('Talk:Foo', 10, [(1, 'one')])
+  cache = WikiCache(str(tmp_path))
+  assert cache.get_section('Talk:Foo', 10, 1) == 'one'
+  # Later puts are reflected without rereading index.tsv
+  cache.put_section('Talk:Foo', 11, 2, 'two')
+  (tmp_path / 'index.tsv').unlink()
+  assert cache.get_section('Talk:Foo', 11, 2) == 'two'
+  assert cache.get_latest_sections('Talk:Foo') == (11, {2: 'two'})
+
+def test_headings(tmp_path):
+  cache = WikiCache(str(tmp_path))
+  assert cache.get_headings('Talk:Foo', 10) is None
+  cache.put_headings('Talk:Foo', 10, [(2, 'Requested move'), (3, 'Survey')])
+  assert WikiCache(str(tmp_path)).get_headings('Talk:Foo', 10) == [
+      (2, 'Requested move'), (3, 'Survey')]
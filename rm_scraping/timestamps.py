@@ -0,0 +1,95 @@
+import calendar
+import datetime
+import re
+from functools import lru_cache
+
+import metrics
+
+MONTHS = {}
+for i in range(1, 13):
+  MONTHS[calendar.month_name[i].lower()] = i
+  MONTHS[calendar.month_abbr[i].lower()] = i
+MONTHS['sept'] = 9
+
+# The time portion of a standard signature, e.g. "04:35, 16 December 2018"
+# (Some people write "04:35 on 16 December 2018")
+SIG_TIME_RE = re.compile(r"\d{2}:\d{2}(?:,|(?: on)) (\d{1,2}) ([A-Za-z]*) (\d{4})")
+_SIG_TIME_FIELDS_RE = re.compile(r"(\d{2}):(\d{2})(?:,| on) (\d{1,2}) ([A-Za-z]+) (\d{4})")
+
+# Formats seen in {{move review talk}} dates. Only ones where the month is
+# spelled out, or the date is in ISO format, so there's no D/M ambiguity.
+_DATE_RES = [
+    # 5 March 2019
+    (re.compile(r'(?P<d>\d{1,2}) (?P<mon>[A-Za-z]+),? (?P<y>\d{4})'), 'mon'),
+    # March 5, 2019
+    (re.compile(r'(?P<mon>[A-Za-z]+) (?P<d>\d{1,2}),? (?P<y>\d{4})'), 'mon'),
+    # 2019 March 5
+    (re.compile(r'(?P<y>\d{4}) (?P<mon>[A-Za-z]+) (?P<d>\d{1,2})'), 'mon'),
+    # 2019-03-05
+    (re.compile(r'(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})'), 'm'),
+]
+
+# The parsers are memoized, so their dateparser fallbacks are counted in these
+# wrappers, once per call rather than once per distinct string.
+
+def parse_sig_time(timestr):
+  """Parse the time portion of a signature (as matched by SIG_TIME_RE) into
+  a datetime. Falls back to dateparser for anything unusual.
+  """
+  dt, fell_back = _parse_sig_time(timestr)
+  if fell_back:
+    metrics.incr('fallback.dateparser')
+  return dt
+
+def parse_date(datestr):
+  """Parse a free-form date (like the date arg of {{move review talk}}) into a
+  date. Returns None if it can't be parsed.
+  """
+  date, fell_back = _parse_date(datestr)
+  if fell_back:
+    metrics.incr('fallback.dateparser')
+  return date
+
+def clear_caches():
+  _parse_sig_time.cache_clear()
+  _parse_date.cache_clear()
+
+@lru_cache(maxsize=2**16)
+def _parse_sig_time(timestr):
+  """Return (datetime, whether we had to fall back to dateparser)."""
+  m = _SIG_TIME_FIELDS_RE.fullmatch(timestr)
+  if m:
+    hour, minute, day, month, year = m.groups()
+    month = MONTHS.get(month.lower())
+    if month:
+      try:
+        return datetime.datetime(int(year), month, int(day), int(hour), int(minute)), False
+      except ValueError:
+        pass
+  # dateparser is slow to import, and rarely needed
+  import dateparser
+  with metrics.timer('dateparser'):
+    return dateparser.parse(timestr), True
+
+@lru_cache(maxsize=2**12)
+def _parse_date(datestr):
+  """Return (date or None, whether we had to fall back to dateparser)."""
+  s = datestr.strip()
+  for rex, month_group in _DATE_RES:
+    m = rex.fullmatch(s)
+    if not m:
+      continue
+    if month_group == 'mon':
+      month = MONTHS.get(m.group('mon').lower())
+    else:
+      month = int(m.group('m'))
+    if month:
+      try:
+        return datetime.date(int(m.group('y')), month, int(m.group('d'))), False
+      except ValueError:
+        pass
+    break
+  import dateparser
+  with metrics.timer('dateparser'):
+    dt = dateparser.parse(s)
+  return dt and dt.date(), True
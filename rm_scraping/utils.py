@@ -1,3 +1,4 @@
+import itertools
 import urllib.parse
 
 def urlencode(s):
@@ -6,3 +7,12 @@ def urlencode(s):
 
 def urldecode(s):
   return urllib.parse.unquote(s).replace('_', ' ')
+
+def chunked(it, n):
+  """Yield lists of up to n consecutive items from the given iterable."""
+  it = iter(it)
+  while 1:
+    chunk = list(itertools.islice(it, n))
+    if not chunk:
+      return
+    yield chunk
@@ -0,0 +1,162 @@
+"""Map the free-text !votes in votes.csv ("Strong oppose", "Support per nom",
+"Weak alternative", ...) to a category (support, oppose, neutral, comment,
+alternative title, ...) and a strength modifier, each as an integer code.
+
+Each distinct vote string is only classified once. classify does one string at
+a time. classify_votes does a whole column of votes (e.g. millions of rows of
+votes.csv): it classifies the column's vocabulary with vectorized string
+operations, then maps the codes back onto every row. Both share the same memo
+(VOCAB).
+
+vote_power is the (cruder, memoized) ranking RM uses to choose between several
+votes by the same user.
+
+Run as a script to write a copy of votes.csv with category and strength columns.
+"""
+import argparse
+import re
+from functools import lru_cache
+
+# A vote's category code is its index in this list
+CATEGORIES = ['none', 'support', 'oppose', 'neutral', 'comment', 'alt', 'other']
+NONE, SUPPORT, OPPOSE, NEUTRAL, COMMENT, ALT, OTHER = range(len(CATEGORIES))
+
+STRENGTHS = ['', 'strong', 'weak']
+PLAIN, STRONG, WEAK = range(len(STRENGTHS))
+
+# Cleanup applied (in order) before classifying. Struck-through text is
+# dropped entirely, since it's been retracted.
+NORMALIZE = [
+    (r'(?i)<(s|del|strike)>.*?</\1>', ' '),
+    (r'<[^>]*>', ' '),
+    (r"[^\w\s'-]|''+", ' '),
+    (r'\s+', ' '),
+]
+
+# Keywords for each category. If a vote has keywords of more than one category,
+# whichever comes first wins (e.g. "Oppose, support alternative"). At the same
+# position, the earlier category in this list wins.
+KEYWORDS = [
+    (OPPOSE, r"oppos\w*|(?:do not|don't|not|no) (?:move|support)\w*|keep|leave|object\w*|disagree\w*|against"),
+    (ALT, r'alt|alternat\w*|counter[ -]?(?:proposal|propose|suggestion)\w*|prefer\w*|instead'),
+    (SUPPORT, r'support\w*|move|rename\w*|agree\w*|endorse\w*|yes|no objections?'),
+    (NEUTRAL, r'neutral\w*|abstain\w*|indifferent'),
+    (COMMENT, r'comment\w*|question\w*|query|note|reply|response|info\w*|notif\w*'),
+]
+CATEGORY_RE = '|'.join(r'\b({})\b'.format(kws) for (_, kws) in KEYWORDS)
+
+STRENGTH_RE = (r'\b(strong\w*|speedy|snow|definite\w*|absolute\w*)\b'
+    r'|\b(weak\w*|tentative\w*|mild\w*|lean\w*|reluctant\w*|slight\w*)\b')
+
+# vote string -> (category, strength)
+VOCAB = {}
+
+def normalize(vote):
+  vote = vote.lower()
+  for pattern, repl in NORMALIZE:
+    vote = re.sub(pattern, repl, vote)
+  return vote.strip()
+
+def _match_code(m, codes, default):
+  """Return the code corresponding to whichever group of m matched."""
+  if not m:
+    return default
+  return codes[m.lastindex - 1]
+
+def classify(vote):
+  """Return (category, strength) codes for the given vote string."""
+  codes = VOCAB.get(vote)
+  if codes is None:
+    norm = normalize(vote)
+    category = _match_code(re.search(CATEGORY_RE, norm),
+        [cat for (cat, _) in KEYWORDS], OTHER if norm else NONE)
+    strength = _match_code(re.search(STRENGTH_RE, norm), [STRONG, WEAK], PLAIN)
+    codes = VOCAB[vote] = (category, strength)
+  return codes
+
+def classify_vocab(vocab):
+  """Return lists of category and strength codes for the given pandas Series
+  of distinct vote strings, classifying them all at once.
+  """
+  norm = vocab.str.lower()
+  for pattern, repl in NORMALIZE:
+    norm = norm.str.replace(pattern, repl, regex=True)
+  norm = norm.str.strip()
+  categories = _extract_codes(norm, CATEGORY_RE, [cat for (cat, _) in KEYWORDS], OTHER)
+  categories[(norm == '').values] = NONE
+  strengths = _extract_codes(norm, STRENGTH_RE, [STRONG, WEAK], PLAIN)
+  return categories.tolist(), strengths.tolist()
+
+def _extract_codes(strs, pattern, codes, default):
+  """Vectorized version of _match_code(re.search(pattern, s), ...) for each s
+  in strs, returned as an array.
+  """
+  import numpy as np
+  matched = strs.str.extract(pattern).notna().values
+  # Index of the (only) group which matched in each row
+  ix = matched.argmax(axis=1)
+  return np.where(matched.any(axis=1), np.asarray(codes)[ix], default)
+
+def classify_votes(votes):
+  """Given a pandas Series of vote strings (with NaN for empty votes), return
+  a DataFrame with the same index, having integer columns category and
+  strength.
+  """
+  import numpy as np
+  import pandas as pd
+  ixs, vocab = pd.factorize(votes.fillna(''))
+  new = [vote for vote in vocab if vote not in VOCAB]
+  if new:
+    VOCAB.update(zip(new, zip(*classify_vocab(pd.Series(new, dtype=object)))))
+  table = np.array([VOCAB[vote] for vote in vocab], dtype=np.int8).reshape(-1, 2)
+  return pd.DataFrame(table[ixs], index=votes.index, columns=['category', 'strength'])
+
+@lru_cache(maxsize=2**12)
+def vote_power(vote):
+  """Return how 'significant' a vote is, for choosing between multiple votes
+  by the same user: 2 for recognizable recommendations, 1 for other bolded
+  text (e.g. '''Comment'''), and 0 for no bolded text.
+  """
+  rec = vote.lower()
+  if rec == '':
+    return 0
+  # Deliberately not classify's categories: this decides which vote is kept
+  # per user in votes.csv, so changing it would change the scraper's output.
+  vote_kws = ('support', 'oppose', 'neutral', 'move', 'close')
+  if any(kw in rec for kw in vote_kws):
+    return 2
+  return 1
+
+def read_table(path):
+  import pandas as pd
+  if path.endswith('.parquet'):
+    return pd.read_parquet(path)
+  return pd.read_csv(path)
+
+def write_table(df, path):
+  if path.endswith('.parquet'):
+    df.to_parquet(path, index=False)
+  else:
+    df.to_csv(path, index=False)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('votes', nargs='?', default='votes.csv',
+      help='Votes table written by scrape.py (csv or parquet)')
+  parser.add_argument('-o', '--output', default='votes_classified.csv',
+      help='Where to write the votes, with category and strength columns added')
+  parser.add_argument('--vocab',
+      help='If given, also write the table of distinct vote strings and their '
+      'codes, with counts, to this csv')
+  args = parser.parse_args()
+  df = read_table(args.votes)
+  classes = classify_votes(df['vote'])
+  df['category'] = classes['category']
+  df['strength'] = classes['strength']
+  write_table(df, args.output)
+  print("Classified {} votes ({} distinct)".format(len(df), len(VOCAB)))
+  print(df['category'].map(dict(enumerate(CATEGORIES))).value_counts().to_string())
+  if args.vocab:
+    vocab = df.groupby(df['vote'].fillna('')).agg(
+        category=('category', 'first'), strength=('strength', 'first'), n=('category', 'size'))
+    vocab.sort_values('n', ascending=False).to_csv(args.vocab)
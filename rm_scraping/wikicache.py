@@ -0,0 +1,179 @@
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+DEFAULT_ROOT = os.path.join('.cache', 'wikitext')
+
+class WikiCache(object):
+  """A compressed, content-addressed on-disk store of wikitext.
+
+  Texts are stored once each under objects/, named by their sha1. index.tsv
+  is an append-only log mapping (page, revid, section_ix) keys to digests, and
+  refs.tsv does the same for arbitrary string keys (e.g. section links, and
+  the heading lists of page revisions). For both, later lines take precedence
+  over earlier ones.
+
+  Each index is read into memory on first use, and kept up to date by puts
+  through this instance (but not by other processes writing to the same root).
+
+  Safe to write to from multiple threads.
+  """
+
+  def __init__(self, root=DEFAULT_ROOT):
+    self.root = root
+    self.lock = threading.Lock()
+    os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+    self.index_path = os.path.join(root, 'index.tsv')
+    self.refs_path = os.path.join(root, 'refs.tsv')
+    self._index = None
+    self._refs = None
+
+  def _blob_path(self, digest):
+    return os.path.join(self.root, 'objects', digest[:2], digest[2:])
+
+  def put_text(self, text):
+    """Store the given text (if not already present) and return its digest."""
+    data = text.encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest()
+    path = self._blob_path(digest)
+    if not os.path.exists(path):
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      tmp = '{}.{}.tmp'.format(path, threading.get_ident())
+      with open(tmp, 'wb') as f:
+        f.write(zlib.compress(data))
+      os.replace(tmp, path)
+    return digest
+
+  def get_text(self, digest):
+    with open(self._blob_path(digest), 'rb') as f:
+      return zlib.decompress(f.read()).decode('utf-8')
+
+  def _append(self, path, fields):
+    line = '\t'.join(map(str, fields)) + '\n'
+    with self.lock:
+      with open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+  def put_section(self, page, revid, section_ix, text):
+    digest = self.put_text(text)
+    self._append(self.index_path, [page, revid, section_ix, digest])
+    if self._index is not None:
+      with self.lock:
+        self._add_to_index(self._index, page, revid, section_ix, digest)
+    return digest
+
+  def put_sections(self, page, revid, sections):
+    """Store a list of (section_ix, text) pairs from the given revision of page."""
+    for section_ix, text in sections:
+      self.put_section(page, revid, section_ix, text)
+
+  @staticmethod
+  def _add_to_index(index, page, revid, section_ix, digest):
+    index.setdefault(page, {}).setdefault(revid, {})[int(section_ix)] = digest
+
+  def _load_index(self):
+    """Return an OrderedDict mapping page names to {revid: {section_ix: digest}},
+    in order of first appearance.
+    """
+    index = OrderedDict()
+    try:
+      f = open(self.index_path, encoding='utf-8')
+    except FileNotFoundError:
+      return index
+    with f:
+      for line in f:
+        page, revid, section_ix, digest = line.rstrip('\n').split('\t')
+        revid = int(revid) if revid != 'None' else None
+        self._add_to_index(index, page, revid, section_ix, digest)
+    return index
+
+  @property
+  def index(self):
+    if self._index is None:
+      self._index = self._load_index()
+    return self._index
+
+  def _latest(self, page):
+    """Return (revid, {section_ix: digest}) for the latest cached revision of
+    page, or None.
+    """
+    revs = self.index.get(page)
+    if not revs:
+      return None
+    revid = max(revs, key=lambda revid: -1 if revid is None else revid)
+    return revid, revs[revid]
+
+  def get_section(self, page, revid, section_ix):
+    """Return the cached text of the given section, or None if it isn't cached."""
+    digest = self.index.get(page, {}).get(revid, {}).get(section_ix)
+    return digest and self.get_text(digest)
+
+  def get_latest_sections(self, page):
+    """Return (revid, {section_ix: text}) for the latest cached revision of the
+    given page, or None if none of its sections are cached.
+    """
+    entry = self._latest(page)
+    if entry is None:
+      return None
+    revid, ix_to_digest = entry
+    return revid, {ix: self.get_text(digest) for ix, digest in ix_to_digest.items()}
+
+  def iter_pages(self):
+    """Yield (page, revid, sections) for the latest cached revision of each page,
+    where sections is a sorted list of (section_ix, text) pairs.
+    """
+    for page in list(self.index):
+      revid, ix_to_digest = self._latest(page)
+      sections = [(ix, self.get_text(ix_to_digest[ix])) for ix in sorted(ix_to_digest)]
+      yield page, revid, sections
+
+  @staticmethod
+  def _headings_key(page, revid):
+    return 'headings:{}:{}'.format(revid, page)
+
+  def put_headings(self, page, revid, headings):
+    """Store the (level, title) of the heading of every section of the given
+    revision of page, in order, so that anchors can be resolved the way the
+    live page would even if only some of its sections are cached.
+    """
+    text = ''.join('{}\t{}\n'.format(level, title) for (level, title) in headings)
+    return self.put_ref(self._headings_key(page, revid), text)
+
+  def get_headings(self, page, revid):
+    """Return the list of (level, title) pairs stored by put_headings, or None."""
+    text = self.get_ref(self._headings_key(page, revid))
+    if text is None:
+      return None
+    headings = []
+    for line in text.splitlines():
+      level, title = line.split('\t', 1)
+      headings.append((int(level), title))
+    return headings
+
+  def _load_refs(self):
+    refs = {}
+    try:
+      f = open(self.refs_path, encoding='utf-8')
+    except FileNotFoundError:
+      return refs
+    with f:
+      for line in f:
+        key, digest = line.rstrip('\n').split('\t')
+        refs[key] = digest
+    return refs
+
+  def put_ref(self, key, text):
+    digest = self.put_text(text)
+    self._append(self.refs_path, [key, digest])
+    if self._refs is not None:
+      self._refs[key] = digest
+    return digest
+
+  def get_ref(self, key):
+    """Return the text stored under the given key, or None."""
+    if self._refs is None:
+      self._refs = self._load_refs()
+    digest = self._refs.get(key)
+    return digest and self.get_text(digest)